@@ -37,24 +37,52 @@ care about indents.
 * always_comb blcoks: :meth:`always_comb`
 * continuous assignments: :meth:`assign`
 * blocking/non-blocking assignemnts :meth:`eq`
-* struct typedef definition: :meth:`struct`
+* struct typedef definition: :meth:`struct`, and packed struct layouts with field offsets,
+  pack/unpack functions and offset localparams: :class:`Struct`, :class:`Field`
 * if-else blocks: :meth:`ifelse`
 * if block: :meth:`If`
+* for loops: :meth:`For`, and rerolling of regular statement lists into loops: :meth:`reroll`
 * file headers: :meth:`header`
 * comments: :meth:`comment`
 * comment header: :meth:`cheader`
 * parameters, localparams, constants: :meth:`parameter` :meth:`localparam`, :meth:`const`
+* array parameters initialised from sequences or arrays: :meth:`param_array`, :meth:`iter_param_array`
 * conversion from (string) ints to SV binary/hex literals: :meth:`ui2b`, :meth:`sui2b`, :meth:`ui2h`, :meth:`sui2h`
 * preprocessor directives: :meth:`ifdef` :meth:`ifndef` :meth:`define` :meth:`endif`
 * import directives: :meth:`Import`
 * signal declarations: :meth:`logic`, :meth:`logvec`, :meth:`decl`
 * I/O definitions for module ports: :meth:`Input`, :meth:`invec`, :meth:`Output`, :meth:`outvec`, :meth:`inputs`, :meth:`outputs`
-* module definitions: :meth:`module`
+* module definitions: :meth:`module`, deduplicated by content with a :class:`ModuleRegistry`
+* column alignment of declarations, assignments, case items and ports: :meth:`align_columns`
+  (``align`` option of :meth:`case`, :meth:`struct`, :meth:`module` and :class:`SVTxt`)
 * package definitions: :meth:`package`
 
 In addition to templating functions, **svtmp** provides a convenience class, :class:`SVTxt` that allows easy
 wrapping of templated code into modules/packages/include segments and writing them into .sv/.svh files together with
-headers.
+headers. :class:`SVTxt` instances can share identical fragments through a :class:`FragmentPool`.
+Independent sections of a large body can be rendered in parallel with :meth:`SVTxt.defer` and
+:meth:`SVTxt.render`.
+Outputs larger than memory can be generated with ``SVTxt(spill = budget)``, which moves the text to
+a temporary file and streams it through wrapping and writing.
+Very large modules can be written as numbered ``.svh`` include shards with ``SVTxt.to_sv_file(..., shard = size)``.
+
+Generated text can be checked for unbalanced blocks and duplicate declarations with :meth:`SVTxt.check`
+(see :mod:`svtmp.lint`) before it is written.
+
+Encoder/decoder generators (thermometer, one-hot, priority, gray) live in :mod:`svtmp.encoders`.
+
+``python -m svtmp watch <scripts>`` (see :mod:`svtmp.watch`) re-runs generator scripts when the Python
+modules or data files their outputs were produced from change.
+Expensive template calls can be memoised on disk across runs with :meth:`svtmp.cache.memoize`.
+Module names, parameters and ports of existing RTL trees can be imported with :class:`svtmp.index.RTLIndex`.
+All the files of a run can be written into a single (deterministic) tar or zip archive with
+:class:`svtmp.bundle.Bundle`, and extracted with ``python -m svtmp extract``, which only rewrites the
+files that changed.
+Generated trees can be regression-tested against golden snapshots (sizes and digests, optionally
+compressed texts) with :class:`svtmp.snapshot.Snapshot` and ``python -m svtmp snapshot update|verify``.
+
+Site-specific templates are looked up by name in :data:`templates` (a :class:`TemplateRegistry`),
+which lazily loads them from ``svtmp.templates`` entry points.
 
 ===============
 svtmp Examples
@@ -213,7 +241,28 @@ SVTMP_INDENTATION_WIDTH = 3
 import logging as log
 from typing import List
 from datetime import date
+from collections.abc import Mapping
 import os
+import re
+import sys
+import weakref
+from itertools import chain
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable
+
+# names exported by ``from svtmp import *`` (the helper modules imported above are not)
+__all__ = [
+    'SVTMP_INDENTATION_WIDTH', 'log', 'List', 'date', 'os', 'INDENT', 'header',
+    'ui2b', 'sui2b', 'ui2h', 'sui2h', 'comment', 'cheader', 'Decl', 'invec', 'Input', 'inputs',
+    'Output', 'outvec', 'outputs', 'struct', 'Field', 'Struct', 'package', 'assign', 'const',
+    'parameter', 'localparam', 'iter_param_array', 'param_array', 'ifdef', 'ifndef', 'define',
+    'endif', 'Import', 'logvec', 'logic', 'decl', 'eq', 'concat', 'If', 'ifelse', 'For',
+    'always_comb', 'make_always_ff', 'always_ff', 'case_item', 'citem', 'case', 'module',
+    'indent', 'align_columns', 'block', 'reroll', 'Fragment', 'FragmentPool', 'FRAGMENT_POOL',
+    'TemplateRegistry', 'templates', 'ModuleRegistry', 'SVTxt',
+]
 
 INDENT = SVTMP_INDENTATION_WIDTH * ' '
 """ default indentation for all templates in svtmp. ``INDENT = SVTMP_INDENTATION_WIDTH * ' '``"""
@@ -394,6 +443,52 @@ def cheader(comment: str) -> str:
     return f"//{78*'-'}\n// {comment}\n//{78*'-'}"
 
 
+class Decl(str):
+    """ a declaration (or port) fragment, as returned by :meth:`logic`, :meth:`logvec`,
+    :meth:`decl`, :meth:`Input`, :meth:`invec`, :meth:`Output` and :meth:`outvec`.
+
+    It behaves exactly as the ``str`` it was built from, and also carries the declared
+    ``name`` and its ``width`` in bits (``None`` if it is not known, e.g. for parameterised
+    ranges or user types), which :class:`SVTxt` collects in its symbol table.
+
+    Example::
+
+        >> d = logvec('cnt', 7, 0)
+        >> d, d.name, d.width
+           ('logic [7:0] cnt;', 'cnt', 8)
+    """
+    def __new__(cls, s: str, name: str = '', width: int | None = None):
+        d = super().__new__(cls, s)
+        d.name = name
+        d.width = width
+        return d
+
+_BIT_TYPES = {'logic', 'bit', 'wire', 'reg'}
+_RANGE_RE = re.compile(r'\[\s*(\d+)\s*:\s*(\d+)\s*\]')
+
+def _vec_width(lhs: int | str, rhs: int | str, typ: str = 'logic') -> int | None:
+    """ width of a ``typ [lhs:rhs]`` vector, if both bounds are integers and ``typ`` is a bit type."""
+    if typ not in _BIT_TYPES:
+        return None
+    try:
+        return abs(int(lhs) - int(rhs)) + 1
+    except (TypeError, ValueError):
+        return None
+
+def _type_width(typ: str) -> int | None:
+    """ width of a ``logic``/``logic [msb:lsb]`` (or ``bit``, ``wire``...) type string."""
+    words = typ.split(None, 1)
+    if not words or words[0] not in _BIT_TYPES:
+        return None
+    if len(words) == 1:
+        return 1
+    m = _RANGE_RE.fullmatch(words[1].strip())
+    return abs(int(m.group(1)) - int(m.group(2))) + 1 if m else None
+
+_LITERAL_RE = re.compile(r"\s*(\d+)\s*'[sS]?[bBoOdDhH]")
+_SELECT_RE = re.compile(r'\s*([A-Za-z_][\w$]*)\s*(?:\[([^\]]*)\])?\s*$')
+_SLICE_RE = re.compile(r'\s*(\d+)\s*:\s*(\d+)\s*$|.*[+-]:\s*(\d+)\s*$')
+
 def invec(name:str, lhs: int | str, rhs: int | str, typ = 'logic') -> str:
     """ generates a packed vector input port. Used to be included in a list of ports
     and passed as argument to :meth:`module` or :meth:`SVTxt.to_module`
@@ -417,7 +512,7 @@ def invec(name:str, lhs: int | str, rhs: int | str, typ = 'logic') -> str:
     if name == '':
         raise ValueError('a port requires a non-empty string name')
     
-    return f'input {typ} [{lhs}:{rhs}] {name}'
+    return Decl(f'input {typ} [{lhs}:{rhs}] {name}', name, _vec_width(lhs, rhs, typ))
 
 def Input(name:str,typ:str = 'logic') -> str:
     """ generates a single input port. Used to be included in a list of ports
@@ -441,7 +536,7 @@ def Input(name:str,typ:str = 'logic') -> str:
     if name == '':
         raise ValueError('a port requires a non-empty string name')
     
-    return f'input {typ} {name}'
+    return Decl(f'input {typ} {name}', name, _type_width(typ))
 
 def inputs(ins: List[str]) -> List[str]:
     """ short-hand function to generate a list of logic single inputs from 
@@ -480,7 +575,7 @@ def Output(name:str,typ:str = 'logic') -> str:
     if name == '':
         raise ValueError('a port requires a non-empty string name')
     
-    return f'output {typ} {name}'
+    return Decl(f'output {typ} {name}', name, _type_width(typ))
 
 def outvec(name:str, lhs:int | str, rhs:int | str, typ = 'logic') -> str:
     """ generates a packed vector output port. Used to be included in a list of ports
@@ -505,7 +600,7 @@ def outvec(name:str, lhs:int | str, rhs:int | str, typ = 'logic') -> str:
     if name == '':
         raise ValueError('a port requires a non-empty string name')
     
-    return f'output {typ} [{lhs}:{rhs}] {name}'
+    return Decl(f'output {typ} [{lhs}:{rhs}] {name}', name, _vec_width(lhs, rhs, typ))
 
 def outputs(outs: List[str]) -> List[str]:
     """ short-hand function to generate a list of logic single outputs from 
@@ -525,7 +620,8 @@ def outputs(outs: List[str]) -> List[str]:
     return list([Output(o) for o in outs])
 
         
-def struct(typ : str, decls : str | List[str], packed : bool = True, debug : bool = False):
+def struct(typ : str, decls : str | Iterable[str], packed : bool = True, debug : bool = False,
+           align : bool = False):
     """ generates SystemVerilog struc type definition.
 
     Example::
@@ -540,15 +636,17 @@ def struct(typ : str, decls : str | List[str], packed : bool = True, debug : boo
 
     Arguments:
         typ: name of the struc type
-        decls: newline-separated string with signal declarations, or list of strings with them
+        decls: newline-separated string with signal declarations, or any iterable of strings with them
+        align: align the columns of the declarations (see :meth:`align_columns`)
 
     Returns: a string with the typedef struct definition
     """
-    if decls == [] or decls == '':
+    decls, head = _peek(decls)
+    if head is None or decls == '':
         raise ValueError('struct definition cannot be empty')
     
     pk = 'packed ' if packed else ''
-    ind_body = indent(_ljoin(decls))
+    ind_body = indent(align_columns(decls) if align else decls)
     s_struct = f'typedef struct {pk}{{\n{ind_body}\n}} {typ};'
     
     if debug:
@@ -556,7 +654,157 @@ def struct(typ : str, decls : str | List[str], packed : bool = True, debug : boo
 
     return s_struct
 
-def package(name: str, body: str | List[str], debug : bool = False):
+_SIZED_TYPES = {'byte': 8, 'shortint': 16, 'int': 32, 'longint': 64, 'integer': 32, 'time': 64}
+
+class Field(object):
+    """ field of a packed :class:`Struct`.
+
+    Arguments:
+        name   : field name.
+        width  : width in bits (deduced for nested structs and ``byte``/``int``/... types,
+                 which have a fixed width).
+        typ    : type: a bit type (``logic``, ``bit``...) declared as ``typ [width-1:0]``, or
+                 any other (e.g. an enum typedef) declared as is, which requires ``width``.
+        struct : nested :class:`Struct` (its typedef name is the type of the field).
+        cmt    : comment of the field declaration.
+    """
+    def __init__(self, name: str, width: int | None = None, typ: str = 'logic',
+                 struct: Struct | None = None, cmt: str = ''):
+        if name == '':
+            raise ValueError('a field requires a non-empty string name')
+        if struct is not None:
+            typ, width = struct.typ, struct.width
+        elif width is None:
+            width = 1 if typ in _BIT_TYPES else _SIZED_TYPES.get(typ)
+            if width is None:
+                raise ValueError(f"field '{name}' of type '{typ}' requires a width")
+        elif typ in _SIZED_TYPES and width != _SIZED_TYPES[typ]:
+            raise ValueError(f"field '{name}' of type '{typ}' is {_SIZED_TYPES[typ]} bits wide, got {width}")
+        if width < 1:
+            raise ValueError(f"field '{name}' must be at least 1 bit wide, got {width}")
+        self.name = name
+        self.width = width
+        self.typ = typ
+        self.struct = struct
+        self.cmt = cmt
+
+    def decl(self) -> str:
+        """ declaration of the field in the struct body."""
+        if self.typ in _BIT_TYPES and self.struct is None:
+            d = f'{self.typ} [{self.width - 1}:0] {self.name};' if self.width > 1 else f'{self.typ} {self.name};'
+        else:
+            d = f'{self.typ} {self.name};'
+        return Decl(f'{d} {comment(self.cmt)}' if self.cmt else d, self.name, self.width)
+
+class Struct(object):
+    """ packed struct type, with the widths and bit offsets of its fields computed once.
+
+    The first field is the most significant one, as in SystemVerilog. Offsets are indexed by
+    field name; fields of nested structs are indexed by their dotted path as well.
+
+    Example::
+
+        >> hdr = Struct('hdr_t', [Field('len', 6), Field('last')])
+        >> pkt = Struct('pkt_t', [Field('hdr', struct = hdr), Field('data', 8)])
+        >> pkt.width, pkt.offsets['hdr'], pkt.offsets['hdr.len']
+           (15, 8, 9)
+        >> print(pkt.slice('hdr.len', 'bus'))
+           bus[14:9]
+        >> print(pkt.typedef())
+           typedef struct packed {
+              hdr_t hdr;
+              logic [7:0] data;
+           } pkt_t;
+
+    Arguments:
+        typ    : name of the struct type.
+        fields : the :class:`Field` objects, most significant first.
+    """
+    def __init__(self, typ: str, fields: Iterable[Field]):
+        self.typ = typ
+        self.fields = list(fields)
+        if not self.fields:
+            raise ValueError('struct definition cannot be empty')
+        self._fields = {}
+        for f in self.fields:
+            if f.name in self._fields:
+                raise ValueError(f"duplicate field '{f.name}' in struct {typ}")
+            self._fields[f.name] = f
+        self.width = sum([f.width for f in self.fields])
+        self.offsets = {}   # field name (or dotted path) -> lsb
+        self.widths = {}    # field name (or dotted path) -> width
+        lsb = self.width
+        for f in self.fields:
+            lsb -= f.width
+            self.offsets[f.name], self.widths[f.name] = lsb, f.width
+            if f.struct is not None:
+                for path, off in f.struct.offsets.items():
+                    self.offsets[f'{f.name}.{path}'] = lsb + off
+                    self.widths[f'{f.name}.{path}'] = f.struct.widths[path]
+
+    def __getitem__(self, name: str) -> Field:
+        return self._fields[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.offsets
+
+    def msb(self, name: str) -> int:
+        """ most significant bit of field ``name`` (a field name or dotted path)."""
+        return self.offsets[name] + self.widths[name] - 1
+
+    def slice(self, name: str, var: str) -> str:
+        """ part select of field ``name`` in a flat vector ``var``."""
+        lsb = self.offsets[name]
+        return f'{var}[{lsb}]' if self.widths[name] == 1 else f'{var}[{self.msb(name)}:{lsb}]'
+
+    def decl(self, name: str, cmt: str = '') -> str:
+        """ declaration of a signal ``name`` of this type (with its width, for :meth:`SVTxt.declare`)."""
+        return Decl(f'{self.typ} {name}; {comment(cmt)}' if cmt else f'{self.typ} {name};', name, self.width)
+
+    def typedef(self, debug: bool = False, align: bool = False) -> str:
+        """ ``typedef struct packed`` definition (see :meth:`struct`)."""
+        return struct(self.typ, [f.decl() for f in self.fields], debug = debug, align = align)
+
+    def _prefix(self) -> str:
+        return self.typ[:-2] if self.typ.endswith('_t') else self.typ
+
+    def localparams(self, prefix: str | None = None) -> List[str]:
+        """ ``localparam`` declarations of the struct width, and of the lsb and width of every
+        field (dotted paths become ``_``), named ``<PREFIX>_<FIELD>_LSB``/``_WIDTH``. ``prefix``
+        defaults to the type name without its ``_t`` suffix, upper-cased."""
+        prefix = (prefix if prefix is not None else self._prefix()).upper()
+        lps = [localparam(f'{prefix}_WIDTH', self.width)]
+        for name, lsb in self.offsets.items():
+            field = f"{prefix}_{name.replace('.', '_').upper()}"
+            lps += [localparam(f'{field}_LSB', lsb), localparam(f'{field}_WIDTH', self.widths[name])]
+        return lps
+
+    def pack_function(self, name: str | None = None) -> str:
+        """ function converting the struct into a flat vector, field by field
+        (named ``<type without _t>_pack`` by default)."""
+        name = name if name is not None else f'{self._prefix()}_pack'
+        body = [logvec('v', self.width - 1, 0)]
+        body += [eq(self.slice(f.name, 'v'), f's.{f.name}', block = True) for f in self.fields]
+        body.append('return v;')
+        return (f'function automatic logic [{self.width - 1}:0] {name}(input {self.typ} s);\n'
+                f'{indent(body)}\nendfunction')
+
+    def unpack_function(self, name: str | None = None) -> str:
+        """ function converting a flat vector into the struct, field by field
+        (named ``<type without _t>_unpack`` by default)."""
+        name = name if name is not None else f'{self._prefix()}_unpack'
+        body = [f'{self.typ} s;']
+        for f in self.fields:
+            rhs = self.slice(f.name, 'v')
+            # enums (and other non-bit, non-struct types) need a cast
+            if f.struct is None and f.typ not in _BIT_TYPES and f.typ not in _SIZED_TYPES:
+                rhs = f"{f.typ}'({rhs})"
+            body.append(eq(f's.{f.name}', rhs, block = True))
+        body.append('return s;')
+        return (f'function automatic {self.typ} {name}(input logic [{self.width - 1}:0] v);\n'
+                f'{indent(body)}\nendfunction')
+
+def package(name: str, body: str | Iterable[str], debug : bool = False):
     """ generates a SystemVerilog package.
 
     Example::
@@ -571,12 +819,12 @@ def package(name: str, body: str | List[str], debug : bool = False):
 
     Arguments:
         name  : name of the package.
-        body  : string or list of strings containing the body of the package. 
+        body  : string or iterable of strings containing the body of the package. 
 
     Returns: a string with the complete SV package.
     """
     
-    ibody = indent(_ljoin(body))
+    ibody = indent(body)
     s_pack = f'package {name};\n{ibody}\nendpackage: {name}'
     if debug:
         log.debug('SVTMP - package: \n{s_pack}')
@@ -635,6 +883,91 @@ def localparam(lhs: str,rhs: str, cmt: str = '', debug: bool = False):
     return s_localparam
 
 
+def iter_param_array(name: str, values, width: int, kind: str = 'localparam', signed: bool = False,
+                     fmt: str = 'h', typ: str = 'logic', line_width: int = 100) -> Iterable[str]:
+    """ generates the lines of a typed, unpacked array parameter initialised from ``values``,
+    one at a time (see :meth:`param_array`). The lines can be passed straight to :meth:`SVTxt.add`,
+    which consumes them as they are produced. Sized inputs (lists, ranges, ``array.array``,
+    NumPy arrays) are not copied: literals are formatted one line at a time. Other iterables
+    are read into a list first, since the declaration starts with the number of elements."""
+    if kind not in ('parameter', 'localparam', 'const'):
+        raise ValueError(f"kind must be 'parameter', 'localparam' or 'const', not '{kind}'")
+    if fmt not in ('h', 'b', 'd'):
+        raise ValueError(f"fmt must be 'h', 'b' or 'd', not '{fmt}'")
+    if width < 1:
+        raise ValueError(f'{width} is not a valid width')
+    if not (hasattr(values, '__len__') and hasattr(values, '__getitem__')):
+        values = list(values)   # iterators: the declaration needs the number of elements
+    n = len(values)
+    if n == 0:
+        raise ValueError('a parameter array cannot be empty')
+    if getattr(values, 'ndim', 1) != 1 or isinstance(values[0], (list, tuple)):
+        raise ValueError('only one-dimensional arrays are supported')
+    lo, hi = (-(1 << (width - 1)), (1 << (width - 1)) - 1) if signed else (0, (1 << width) - 1)
+    if hasattr(values, 'min'):  # numpy
+        vmin, vmax = int(values.min()), int(values.max())
+    else:
+        vmin, vmax = min(values), max(values)
+    if vmin < lo or vmax > hi:
+        raise ValueError(f'{vmin if vmin < lo else vmax} cannot be represented in {width} {"signed " if signed else ""}bits')
+
+    sg = 's' if signed else ''
+    mask = (1 << width) - 1
+    if fmt == 'h':
+        pre, spec = f"{width}'{sg}h", f'0{(width + 3) // 4}X'
+    elif fmt == 'b':
+        pre, spec = f"{width}'{sg}b", f'0{width}b'
+    else:
+        pre = f"{width}'{sg}d"
+
+    styp = f'{typ} signed' if signed else typ
+    yield f"{kind} {styp} [{width - 1}:0] {name} [{n}] = '{{"
+    if fmt != 'd':
+        # fixed size literals: the same number of items on every line, formatted line by line
+        per_line = max(1, (line_width - len(INDENT)) // (len(pre) + len(format(0, spec)) + 2))
+        for i in range(0, n, per_line):
+            sep = ',' if i + per_line < n else ''
+            yield INDENT + ', '.join([pre + format(int(v) & mask, spec) for v in values[i:i + per_line]]) + sep
+    else:
+        line, size = [], len(INDENT)
+        for v in values:
+            v = int(v)
+            lit = pre + str(v) if v >= 0 else f'-{pre}{-v}'
+            if line and size + len(lit) + 2 > line_width:
+                yield INDENT + ', '.join(line) + ','
+                line, size = [], len(INDENT)
+            line.append(lit)
+            size += len(lit) + 2
+        yield INDENT + ', '.join(line)
+    yield '};'
+
+def param_array(name: str, values, width: int, kind: str = 'localparam', signed: bool = False,
+                fmt: str = 'h', typ: str = 'logic', line_width: int = 100) -> str:
+    """ generates a typed, unpacked array parameter (or localparam/const) initialised from
+    ``values``, wrapping the ``'{...}`` literal at ``line_width`` characters.
+
+    Example::
+
+      >> print(param_array('COEF', [18, -18, 1, 0, -1], 16, signed = True, line_width = 40))
+         localparam logic signed [15:0] COEF [5] = '{
+            16'sh0012, 16'shFFEE, 16'sh0001,
+            16'sh0000, 16'shFFFF
+         };
+
+    Arguments:
+        name       : parameter name.
+        values     : integers: any iterable, ``array.array`` or (one-dimensional) NumPy array.
+        width      : width of every element, in bits.
+        kind       : ``parameter``, ``localparam`` or ``const``.
+        signed     : signed elements (two's complement literals), unsigned otherwise.
+        fmt        : literal format, ``'h'`` (hex), ``'b'`` (binary) or ``'d'`` (decimal).
+        typ        : element type.
+        line_width : maximum line length (a line holds at least one element).
+
+    Returns: a string with the parameter declaration. Use :meth:`iter_param_array` to stream it.
+    """
+    return '\n'.join(iter_param_array(name, values, width, kind, signed, fmt, typ, line_width))
+
 def ifdef(s: str) -> str:
     return f'`ifdef {s}'
 
@@ -662,7 +995,7 @@ def logvec(name, lsb, rsb,cmt = '', debug: bool = False):
 
     if debug:
         log.debug(f'SVTMP - logic vector declaration: {s_logvec}')
-    return s_logvec
+    return Decl(s_logvec, name, _vec_width(lsb, rsb))
         
 
 def logic(name: str, cmt: str = '', debug: bool = False):
@@ -676,7 +1009,7 @@ def logic(name: str, cmt: str = '', debug: bool = False):
         
     if debug:
         log.debug(f'SVTMP - logic declaration: {s_logic}')
-    return s_logic
+    return Decl(s_logic, name, 1)
 
 def decl(typ: str, name: str, cmt: str  = '', debug: bool = False):
     if name == '':
@@ -689,7 +1022,7 @@ def decl(typ: str, name: str, cmt: str  = '', debug: bool = False):
         
     if debug:
         log.debug(f'SVTMP - signal declaration: {s_decl}')
-    return s_decl
+    return Decl(s_decl, name, _type_width(typ))
 
 def eq(lhs,rhs, block = False, debug: bool = False):
     op = '=' if block else '<='
@@ -704,13 +1037,13 @@ def concat(items: List[str], debug: bool = False):
         log.debug(f'SVTMP - concatenation: {s_concat}')
     return s_concat
 
-def If(cond: str, body: str | List[str], debug: bool = False):
+def If(cond: str, body: str | Iterable[str], debug: bool = False):
     s_if = f'if ({cond})\n{block(body)}'
     if debug:
         log.debug(f'SVTMP - if-block:\n {s_if}')
     return s_if
 
-def ifelse(cond: str, tbody: str | List[str], fbody: str | List[str], debug: bool = False):
+def ifelse(cond: str, tbody: str | Iterable[str], fbody: str | Iterable[str], debug: bool = False):
     s = f'if ({cond})\n'
     s += block(tbody)
     s += f'\nelse\n'
@@ -719,7 +1052,43 @@ def ifelse(cond: str, tbody: str | List[str], fbody: str | List[str], debug: boo
         log.debug(f'SVTMP - if-else-block:\n {s}')
     return s
 
-def always_comb(body: str | List[str], debug: bool = False):
+def For(var: str, start: int | str, stop: int | str, body: str | Iterable[str],
+        step: int = 1, typ: str = 'int', debug: bool = False):
+    """ generates a procedural for loop.
+
+    Example::
+
+      >> print(For('i', 0, 16, eq('th_o[i]', 'i <= sel_i', block = True)))
+         for (int i = 0; i < 16; i++)
+            th_o[i] = i <= sel_i;
+
+      >> print(For('i', 15, -1, eq('x[i]', '1\'b0'), step = -1))
+         for (int i = 15; i > -1; i--)
+            x[i] <= 1'b0;
+
+    Arguments:
+        var   : loop variable name.
+        start : first value of the loop variable.
+        stop  : (excluded) last value of the loop variable.
+        body  : string or list of strings with the loop body.
+        step  : loop variable increment (negative for descending loops).
+        typ   : loop variable type (``genvar`` for generate loops).
+
+    Returns: a string with the for loop.
+    """
+    if step == 0:
+        raise ValueError('a for loop requires a non-zero step')
+    cmp = '<' if step > 0 else '>'
+    if step in (1, -1):
+        incr = f'{var}++' if step > 0 else f'{var}--'
+    else:
+        incr = f'{var} += {step}' if step > 0 else f'{var} -= {-step}'
+    s_for = f'for ({typ} {var} = {start}; {var} {cmp} {stop}; {incr})\n{block(body)}'
+    if debug:
+        log.debug(f'SVTMP - for loop:\n {s_for}')
+    return s_for
+
+def always_comb(body: str | Iterable[str], debug: bool = False):
     s_always_comb = f'always_comb\n{block(body)}'
     if debug:
         log.debug(f'SVTMP - always_comb block:\n {s_always_comb}')
@@ -728,11 +1097,11 @@ def always_comb(body: str | List[str], debug: bool = False):
 
 def make_always_ff(clk = 'clk_i', reset = 'reset_n_i',elevel = True, rlevel = False):
     def aff(rbody, body):
-        return always_ff(body, rbody, clk, reset, elevel, rlevel)
+        return always_ff(rbody, body, clk, reset, elevel, rlevel)
     return aff
     
-def always_ff(rbody: str | List[str],
-              body:  str | List[str],
+def always_ff(rbody: str | Iterable[str],
+              body:  str | Iterable[str],
               clk:   str = 'clk_i',
               reset: str = 'reset_n_i',
               elevel: bool = True,
@@ -755,33 +1124,149 @@ def case_item(cond, body):
 def citem(cond, body):
     return f'{cond}: {block(body)}'
 
-def case(key: str, body: str | List[str]):
-    return f'case({key})\n{indent(body)}\nendcase\n'
+def case(key: str, body: str | Iterable[str], kind: str = 'case', roll: bool = False,
+         width: int | None = None, fanout: int | None = None, align: bool = False):
+    """ generates a case statement.
+
+    ``body`` items are either rendered case items (see :meth:`citem`) or ``(key, body)``
+    tuples, where ``key`` is an integer (rendered as a ``width``-bit hex literal) or
+    ``'default'``. Large tables of tuples can be split into a decode tree: with ``fanout``,
+    the items are grouped by the upper ``log2(fanout)`` bits of their key into nested
+    case statements on ``key[msb:lsb]`` slices, level by level, until every case has at
+    most ``fanout`` items. The default item is repeated in every nested case that does
+    not cover all its values, so the tree is functionally identical to the flat case.
+
+    Example::
 
-def module(name:str, body: List[str] | str,
-           ios:        List[str] | str | None = None,
-           parameters: List[str] | str | None = None,
-           imports:    List[str] | str | None = None) -> str:
+      >> print(case('addr_i', [(k, eq('rd_o', f'reg{k}')) for k in (0, 1, 8, 9)], width = 4, fanout = 2))
+         case(addr_i[3:3])
+            1'h0: begin
+               case(addr_i[2:0])
+                  3'h0:    rd_o <= reg0;
+                  3'h1:    rd_o <= reg1;
+               endcase
+               
+            end
+            1'h1: begin
+               case(addr_i[2:0])
+                  3'h0:    rd_o <= reg8;
+                  3'h1:    rd_o <= reg9;
+               endcase
+               
+            end
+         endcase
+
+    Arguments:
+        key    : case expression (a signal name if ``fanout`` is used).
+        body   : iterable of case items or ``(key, body)`` tuples, or a string with the case items.
+        kind   : ``case``, ``casez``, ``unique case``...
+        roll   : replace regular item lists by an equivalent for loop (see :meth:`reroll`).
+        width  : key width for ``(key, body)`` items (derived from the largest key if ``None``).
+        fanout : maximum number of items per case statement of the decode tree (a power of 2).
+        align  : align the bodies (and trailing comments) of consecutive case items (see :meth:`align_columns`).
+
+    Returns: a string with the case statement.
+    """
+    body, head = _peek(body)
+    if isinstance(head, tuple):
+        default = None
+        keyed = []
+        for item in body:
+            if not isinstance(item, tuple):
+                raise ValueError('case items cannot mix rendered items and (key, body) tuples')
+            if item[0] == 'default':
+                default = item[1]
+            else:
+                keyed.append(item)
+        if any(keyed[i][0] > keyed[i + 1][0] for i in range(len(keyed) - 1)):
+            keyed.sort(key = lambda item: item[0])
+        if width is None:
+            width = max(1, keyed[-1][0].bit_length()) if keyed else 1
+        if keyed and keyed[0][0] < 0:
+            raise ValueError(f'case key {keyed[0][0]} is negative')
+        if keyed and keyed[-1][0] >= 1 << width:
+            raise ValueError(f'case key {keyed[-1][0]} does not fit in {width} bits')
+        if fanout is None:
+            fanout = 1 << width
+        if fanout < 2 or fanout & (fanout - 1):
+            raise ValueError(f'case fanout must be a power of 2, not {fanout}')
+        s = _case_tree(key, keyed, default, width - 1, 0, fanout.bit_length() - 1, kind, width)
+        return align_columns(s) if align else s
+
+    if roll and kind == 'case' and not isinstance(body, str):
+        body = list(body)
+        loop = _reroll_case(key, body)
+        if loop is not None:
+            return loop
+    if align:
+        body = align_columns(body)
+    return f'{kind}({key})\n{indent(body)}\nendcase\n'
+
+def _case_tree(key: str, items: list, default, msb: int, lsb: int, bits: int, kind: str, width: int) -> str:
+    """ decode tree for the sorted ``(key, body)`` items on ``key[msb:lsb]``: one linear
+    pass per level groups the items by their upper ``bits`` bits."""
+    nbits = msb - lsb + 1
+    sel = key if nbits == width else f'{key}[{msb}:{lsb}]'
+    mask = (1 << nbits) - 1
+    if len(items) <= (1 << bits) or nbits <= bits:
+        citems = [citem(ui2h((k >> lsb) & mask, nbits), b) for k, b in items]
+        if default is not None and len(items) < (1 << nbits):
+            citems.append(citem('default', default))
+        return case(sel, citems, kind)
+
+    sub_msb = msb - bits
+    groups, start = [], 0
+    for i in range(1, len(items) + 1):
+        if i == len(items) or (items[i][0] >> (sub_msb + 1)) != (items[start][0] >> (sub_msb + 1)):
+            groups.append(items[start:i])
+            start = i
+    citems = []
+    for group in groups:
+        g = (group[0][0] >> (sub_msb + 1)) & ((1 << bits) - 1)
+        citems.append(citem(ui2h(g, bits), _case_tree(key, group, default, sub_msb, lsb, bits, kind, width)))
+    if default is not None and len(groups) < (1 << bits):
+        citems.append(citem('default', default))
+    return case(f'{key}[{msb}:{sub_msb + 1}]', citems, kind)
+
+def module(name:str, body: Iterable[str] | str,
+           ios:        Iterable[str] | str | None = None,
+           parameters: Iterable[str] | str | None = None,
+           imports:    Iterable[str] | str | None = None,
+           align:      bool = False) -> str:
     
+    s = _module_head(name, ios, parameters, imports, align)
+    s += indent(align_columns(body) if align else body)
+    s += '\nendmodule\n'
+    return s
+
+def _module_head(name:str,
+                 ios:        Iterable[str] | str | None = None,
+                 parameters: Iterable[str] | str | None = None,
+                 imports:    Iterable[str] | str | None = None,
+                 align:      bool = False) -> str:
+    """ returns the text of :meth:`module` that precedes the module body."""
+    fmt = align_columns if align else (lambda s: s)
+    ios = _peek(ios)[0] if ios is not None else None
+    parameters = _peek(parameters)[0] if parameters is not None else None
+    imports = _peek(imports)[0] if imports is not None else None
     s = f'module {name}\n' if ios else f'module {name}; \n'
     if imports:
-        s += indent(_ljoin(imports))
+        s += indent(imports)
         s += '\n'
     if parameters:
-        s += indent(',\n'.join(parameters),spaces = 5 * ' ', first = '  #( ')
+        s += indent(fmt(',\n'.join(parameters)),spaces = 5 * ' ', first = '  #( ')
         s += "\n     )\n"
 
     if ios:
-        s += indent(',\n'.join(ios),spaces = 4 * ' ',  first = '  ( ')
+        s += indent(fmt(',\n'.join(ios)),spaces = 4 * ' ',  first = '  ( ')
         
     s += '\n   );\n\n'
-    s += indent(_ljoin(body))
-    s += '\nendmodule\n'
     return s
 
-def indent(fragment: List[str] | str, spaces:str = INDENT, first:str = INDENT) -> str:
-    """ takes a (potentially) multiline string or a list of strings and indents it
-    (joining the result by newlines if the input was a list of strings)
+def indent(fragment: Iterable[str] | str, spaces:str = INDENT, first:str = INDENT) -> str:
+    """ takes a (potentially) multiline string or any iterable of strings (list, generator...)
+    and indents it (joining the result by newlines if the input was an iterable of strings).
+    Iterables are consumed in a single pass.
 
     Example 1::
 
@@ -799,33 +1284,122 @@ def indent(fragment: List[str] | str, spaces:str = INDENT, first:str = INDENT) -
            c
 
     Arguments:
-        fragment : string or list of strings to be indented.
+        fragment : string or iterable of strings to be indented.
         spaces   : indentation string (normally a number of consecutive spaces) for all lines except for first.
         first    : indentation string for first line/string in list.
 
     Returns:
         a string with indented input (either indented string or newling-concatenated string with list strings indented.
     """
-    if isinstance(fragment, list):
-        items = []
-        for s in fragment:
-            lines = s.split('\n')
-            items.extend(lines)
+    nl = '\n' + spaces
+    if isinstance(fragment, str):
+        return first + fragment.replace('\n', nl)
+
+    def indented_items():
+        items = iter(fragment)
+        for s in items:
+            yield first + s.replace('\n', nl)
+            break
+        for s in items:
+            yield spaces + s.replace('\n', nl)
+
+    return '\n'.join(indented_items())
+
+_ID = r'[A-Za-z_][\w$]*'
+_ALIGN_DECL = re.compile(r'(\s*)(?:(input|output|inout|parameter|localparam|const)\s+)?'
+                         r'((?:' + _ID + r'(?:::' + _ID + r')?\s+)*?)((?:\[[^\]]*\]\s*)*)'
+                         r'(' + _ID + r')\s*(=[^;,]*?)?\s*([;,]?)\s*(//.*)?$')
+_ALIGN_ASSIGN = re.compile(r'(\s*)(?:(assign)\s+)?([A-Za-z_{][^=<>!;]*?)\s*(<=|=)\s*([^;]*;)\s*(//.*)?$')
+_ALIGN_CITEM = re.compile(r"(\s*)((?:default|[\w'?]+(?:\s*,\s*[\w'?]+)*)\s*:)\s+(.*?)\s*(//.*)?$")
+# statements/keywords that look like declarations, assignments or case items
+_ALIGN_KEYWORDS = {'assign', 'return', 'else', 'begin', 'end', 'import', 'typedef', 'if', 'for',
+                   'while', 'case', 'casez', 'casex', 'unique', 'priority', 'module', 'package',
+                   'endcase', 'endmodule', 'endpackage', 'endfunction', 'endtask', 'function', 'task'}
+
+def _align_fields(line: str):
+    """ splits ``line`` into (kind, indentation, fields, comment), or returns ``None`` if
+    it is not an alignable line. The last non-empty field carries the statement terminator."""
+    m = _ALIGN_DECL.match(line)
+    if m:
+        ind, qual, typ, rng, name, init, term, cmt = m.groups()
+        typ = typ.strip()
+        if (qual or (typ and term)) and typ.split(' ', 1)[0] not in _ALIGN_KEYWORDS:
+            kind = 'decl' if not qual else 'port' if qual[0] in 'io' else 'param'
+            return kind, ind, [qual or '', typ, rng.strip(), name, (init or '').strip()], term, cmt
+    m = _ALIGN_CITEM.match(line)
+    if m:
+        ind, cond, body, cmt = m.groups()
+        if cond[:-1].strip() not in _ALIGN_KEYWORDS:
+            return 'citem', ind, [cond, body], '', cmt
+    m = _ALIGN_ASSIGN.match(line)
+    if m:
+        ind, kw, lhs, op, rhs, cmt = m.groups()
+        if lhs.split(' ', 1)[0] not in _ALIGN_KEYWORDS:
+            return kw or 'eq', ind, [kw or '', lhs, op, rhs.strip()], '', cmt
+    return None
+
+def align_columns(fragment: str | Iterable[str]) -> str:
+    """ aligns the columns of consecutive declarations (qualifier/direction, type, range,
+    name, ``=``), assignments (``=``/``<=``), case items (item bodies) and their trailing
+    comments. Lines of other kinds, or with a different indentation, start a new group.
+
+    Works in two linear passes: the first splits the lines and measures the columns of
+    every group, the second pads them.
 
-    elif isinstance(fragment, str):
-        items = fragment.split('\n')
-        
-        
-    indented_items = []
-    for i,item in enumerate(items):
-        if i == 0:
-            indented_items.append(first  + item)
-        else:
-            indented_items.append(spaces  + item)
+    Example::
 
-    return '\n'.join(indented_items)
+      >> print(align_columns([logic('en'), logvec('cnt', 7, 0, cmt = 'counter'), logic('busy', 'state')]))
+         logic       en;
+         logic [7:0] cnt;  // counter
+         logic       busy; // state
 
-def block(s: str | List[str]) -> str:
+    Arguments:
+        fragment : string or iterable of strings (lines, or multi-line fragments).
+
+    Returns: a string with the aligned lines.
+    """
+    if not isinstance(fragment, str):
+        fragment = '\n'.join(fragment)
+    lines = fragment.split('\n')
+    parsed = [_align_fields(l) for l in lines]
+
+    # first pass: column widths of every group of consecutive lines of the same kind
+    widths = []     # per line, the (shared) widths of its group
+    group, key = None, None
+    for p in parsed:
+        k = p and (p[0], p[1])
+        if k != key:
+            key = k
+            group = [0] * len(p[2]) + [0] if p else None
+        if p:
+            fields = p[2]
+            last = max([i for i, f in enumerate(fields) if f] or [0])
+            for i in range(last):
+                if len(fields[i]) > group[i]:
+                    group[i] = len(fields[i])
+        widths.append(group)
+
+    # second pass: padding (the code width of a group is known once its lines are padded)
+    out, code = [], []
+    for p, w, line in zip(parsed, widths, lines):
+        if not p:
+            code.append(None)
+            out.append(line)
+            continue
+        kind, ind, fields, term, cmt = p
+        last = max([i for i, f in enumerate(fields) if f] or [0])
+        s = ''.join([fields[i].ljust(w[i]) + ' ' for i in range(last) if w[i]])
+        s = ind + s + fields[last] + term
+        if len(s) > w[-1]:
+            w[-1] = len(s)
+        code.append(cmt)
+        out.append(s)
+    for i, (cmt, w) in enumerate(zip(code, widths)):
+        if cmt:
+            out[i] = out[i].ljust(w[-1]) + ' ' + cmt
+    return '\n'.join(out)
+
+def block(s: str | Iterable[str], roll: bool = False) -> str:
     """ takes a newline separated string of commands or a list of string commands, and returns a newline separated string of indented commands, wrapped by begin-end if necessary.
 
     Examples::
@@ -847,27 +1421,43 @@ def block(s: str | List[str]) -> str:
              end
 
     Arguments:
-        s : a string of newline separated statements or a list of statement strings
+        s    : a string of newline separated statements or an iterable of statement strings
+        roll : replace regular runs of statements in a list by ``for`` loops (see :meth:`reroll`)
 
     Returns: 
         an indented, possibly wrapped in begin-end string with the input statements
     """
+    if roll and not isinstance(s, str):
+        s = reroll(list(s))
+
     if isinstance(s, str):
         if '\n' in s[:-1]: #more than 2 lines
-            lines = s.split('\n')
-            return f'begin\n{indent(_ljoin(s))}\nend'
+            return f'begin\n{indent(s)}\nend'
         else:
             return indent(s)
-        
-    elif isinstance(s, list):
-        if len(s) > 1:
-            return f'begin\n{indent(_ljoin(s))}\nend'
-        else:
-            return indent(s[0])
+
+    items = iter(s)
+    first = next(items, None)
+    if first is None:
+        raise ValueError('a block cannot be empty')
+    second = next(items, None)
+    if second is None:
+        return indent(first)
+    return f'begin\n{indent(chain((first, second), items))}\nend'
 
 
-def _ljoin(strs: List[str] | str) -> str:
-    """ returns the newline-concatenation of a list of strings into a single string.
+def _peek(items: Iterable[str] | str):
+    """ returns ``(items, first item)`` without losing the first item of one-pass iterables
+    (``first item`` is ``None`` for empty iterables). Strings and sequences are returned as they are.
+    """
+    if isinstance(items, (str, list, tuple)):
+        return items, (items[0] if items else None)
+    it = iter(items)
+    head = next(it, None)
+    return (chain((head,), it) if head is not None else ()), head
+
+def _ljoin(strs: Iterable[str] | str) -> str:
+    """ returns the newline-concatenation of an iterable of strings into a single string.
 
     Example::
 
@@ -882,49 +1472,1325 @@ def _ljoin(strs: List[str] | str) -> str:
     else:
         return '\n'.join(strs)
 
-class SVTxt(object):
+_NUM_RE = re.compile(r"(?<![\w$'.])(?:(\d+)'([bBoOdDhH])([0-9a-fA-F_]+)|(\d+))(?![\w'.])")
+_BASES = {'b': 2, 'o': 8, 'd': 10, 'h': 16}
+_RANGE_SEL_RE = re.compile(r'\[([^\[\]]*)\]')
+
+def _reroll_split(stmt: str):
+    """ splits a single-line statement into its skeleton (the text around integer
+    literals, including the width/base of sized literals) and its integer slots
+    (value and text, without the width/base of sized literals)."""
+    if '\n' in stmt or '"' in stmt or '//' in stmt or '/*' in stmt:
+        return None
+    skel, slots, pos = [], [], 0
+    for m in _NUM_RE.finditer(stmt):
+        width, base, digits, plain = m.groups()
+        if plain is None:
+            skel.append(stmt[pos:m.start()] + f"{width}'{base.lower()}")
+            slots.append((int(digits.replace('_', ''), _BASES[base.lower()]), digits))
+        else:
+            skel.append(stmt[pos:m.start()])
+            slots.append((int(plain), plain))
+        pos = m.end()
+    skel.append(stmt[pos:])
+    return tuple(skel), slots
+
+def _reroll_expr(a: int, b: int, var: str) -> str:
+    if b == 0:
+        return str(a)
+    term = var if abs(b) == 1 else f'{abs(b)}*{var}'
+    if b < 0:
+        return f'{a} - {term}'
+    if a == 0:
+        return term
+    return f'{term} + {a}' if a > 0 else f'{term} - {-a}'
+
+def _reroll_body(skel: tuple, rows: list, var: str) -> str | None:
+    """ renders the loop body for the statements described by ``skel`` and their slot
+    values ``rows``, or ``None`` if some slot is not an affine function of the index."""
+    n = len(rows)
+    out = [skel[0]]
+    for k in range(len(skel) - 1):
+        v0, txt0 = rows[0][k]
+        b = rows[1][k][0] - v0
+        texts = set()
+        for j in range(n):
+            v, txt = rows[j][k]
+            if v != v0 + b * j:
+                return None
+            texts.add(txt)
+        prev, nxt = skel[k], skel[k + 1]
+        if b == 0 and len(texts) == 1:
+            out.append(txt0 + nxt)
+            continue
+        if prev.rstrip().endswith('{') and nxt.lstrip().startswith('{'):
+            return None     # a replication count must be constant
+        expr = _reroll_expr(v0, b, var)
+        if prev.endswith("'b") or prev.endswith("'o") or prev.endswith("'d") or prev.endswith("'h"):
+            width_base = prev[len(prev.rstrip("0123456789'bodh")):]
+            width = int(width_base.split("'")[0])
+            vmax = max(v0, v0 + b * (n - 1))
+            if min(v0, v0 + b * (n - 1)) < 0 or vmax >= 2**width:
+                return None
+            out[-1] = out[-1][:len(out[-1]) - len(width_base)]
+            # a size cast keeps the signedness of the (int) loop variable: with the msb set,
+            # the signed result would sign-extend where the unsigned literal zero-extends
+            if vmax >= 2**(width - 1):
+                expr = f"unsigned'({expr})"
+            out.append(f"{width}'({expr})" + nxt)
+        elif (expr == var or
+              (prev.rstrip()[-1:] in ('[', ':') and nxt.lstrip()[:1] in (']', ':', '+', '-'))):
+            out.append(expr + nxt)
+        else:
+            out.append(f'({expr})' + nxt)
+    return ''.join(out)
+
+def _reroll_var(stmts: List[str]) -> str:
+    for var in ('i', 'j', 'k', 'ii', 'jj', 'kk'):
+        if not any(re.search(rf'\b{var}\b', s) for s in stmts):
+            return var
+    return ''
+
+def _reroll_variable_range(body: str, var: str) -> bool:
+    """ ``True`` if the loop variable appears in a ``[msb:lsb]`` range select, which
+    is only legal with constant (genvar) indexes."""
+    for m in _RANGE_SEL_RE.finditer(body):
+        sel = m.group(1)
+        if ':' not in sel or not re.search(rf'\b{var}\b', sel):
+            continue
+        parts = re.split(r'([+-]?:)', sel, maxsplit = 1)
+        if parts[1] == ':' or re.search(rf'\b{var}\b', parts[2]):
+            return True
+    return False
+
+def reroll(stmts: List[str], generate: bool = False, min_items: int = 4) -> List[str]:
+    """ detects runs of consecutive single-line statements that only differ by integer
+    literals that are affine functions of their position, and replaces each run by an
+    equivalent ``for`` loop (a ``generate for`` loop of ``assign`` statements if
+    ``generate`` is ``True``).
+
+    The loop body is derived so that its ``k``-th iteration is textually the ``k``-th
+    original statement with literals replaced by expressions of the loop variable
+    (sized literals become size casts, e.g. ``4'(i)``, or ``4'(unsigned'(i))`` when values
+    reach the most significant bit, to keep them unsigned). Runs that cannot be proven
+    equivalent (non-affine literals, range selects with a variable bound in procedural
+    code, comments, strings or multi-line statements) are kept unrolled.
+
+    Example::
+
+        >> print(_ljoin(reroll([eq(f'data[{i}]', f'in[{i+1}]') for i in range(8)])))
+           for (int i = 0; i < 8; i++)
+              data[i] <= in[i + 1];
+
+    Arguments:
+        stmts     : list of statements.
+        generate  : module-level statements (only ``assign`` statements are rerolled).
+        min_items : shortest run that is rerolled.
+
+    Returns: a list of statements, with rerolled runs replaced by loops.
+    """
+    min_items = max(min_items, 2)
+    split = [_reroll_split(s) for s in stmts]
+    out = []
+    i = 0
+    while i < len(stmts):
+        j = i + 1
+        if split[i] is not None:
+            while j < len(stmts) and split[j] is not None and split[j][0] == split[i][0]:
+                j += 1
+        run = stmts[i:j]
+        loop = None
+        if j - i >= min_items and (not generate or stmts[i].startswith('assign ')):
+            var = _reroll_var(run)
+            body = _reroll_body(split[i][0], [sp[1] for sp in split[i:j]], var) if var else None
+            if body is not None and generate:
+                loop = f'for (genvar {var} = 0; {var} < {j - i}; {var}++)\nbegin\n{indent(body)}\nend'
+                loop = f'generate\n{indent(loop)}\nendgenerate'
+            elif body is not None and not _reroll_variable_range(body, var):
+                loop = For(var, 0, j - i, body)
+        if loop is None:
+            out += run
+        else:
+            out.append(loop)
+        i = j
+    return out
+
+def _reroll_case(key: str, body: List[str], min_items: int = 4) -> str | None:
+    """ rerolls a full list of single-line case items ``key: stmt`` with distinct,
+    affine keys into ``for (...) if (key == K(i)) stmt(i)``, or returns ``None``."""
+    if len(body) < max(min_items, 2):
+        return None
+    keys, stmts = [], []
+    for item in body:
+        m = re.match(r'([^:\n]+):\s+(\S.*)$', item)
+        if m is None:
+            return None
+        keys.append(m.group(1).strip())
+        stmts.append(m.group(2))
+    ksplit = [_reroll_split(k) for k in keys]
+    ssplit = [_reroll_split(s) for s in stmts]
+    if any(sp is None or sp[0] != ksplit[0][0] for sp in ksplit):
+        return None
+    if any(sp is None or sp[0] != ssplit[0][0] for sp in ssplit):
+        return None
+    kskel = ksplit[0][0]
+    if len(kskel) != 2 or not re.fullmatch(r"(\d+'[bodh])?", kskel[0]) or kskel[1] != '':
+        return None
+    krows = [sp[1] for sp in ksplit]
+    var = _reroll_var([key] + body)
+    if not var or krows[1][0][0] == krows[0][0][0]:
+        return None
+    kexpr = _reroll_body(kskel, krows, var)
+    stmt = _reroll_body(ssplit[0][0], [sp[1] for sp in ssplit], var)
+    if kexpr is None or stmt is None or _reroll_variable_range(stmt, var):
+        return None
+    return For(var, 0, len(body), If(f'{key} == {kexpr}', stmt)) + '\n'
+
+class Fragment(str):
+    """ a rendered SystemVerilog fragment that can be shared through a :class:`FragmentPool`.
+
+    It behaves exactly as the ``str`` it was built from; the subclass only exists
+    so that the pool can hold it through a weak reference.
+    """
+    __slots__ = ('__weakref__',)
+
+class FragmentPool(object):
+    """ interning pool for rendered fragments.
+
+    Structurally identical fragments (same rendered text) are stored once, keyed by
+    the content hash of the text. The pool only keeps weak references, so a fragment
+    is collected as soon as no :class:`SVTxt` (or user code) refers to it any more.
+
+    Example::
+
+        >> pool = FragmentPool()
+        >> a = pool.intern(always_ff(eq('q', ui2b(0,1)), eq('q', 'd')))
+        >> b = pool.intern(always_ff(eq('q', ui2b(0,1)), eq('q', 'd')))
+        >> a is b
+           True
+
+    """
     def __init__(self):
-        self.txt = ""
+        self._frags = weakref.WeakValueDictionary()
 
-    def sep(self, n : int = 1):
-        self.txt += '\n'*n
+    def __len__(self):
+        return len(self._frags)
+
+    def intern(self, s: str) -> str:
+        """ returns the shared copy of ``s``, adding it to the pool if needed.
+
+        Arguments:
+            s : rendered fragment.
+
+        Returns:
+            a :class:`Fragment` equal to ``s`` (``s`` itself on a hash collision).
+        """
+        key = (len(s), hash(s))
+        frag = self._frags.get(key)
+        if frag is None:
+            frag = s if isinstance(s, Fragment) else Fragment(s)
+            self._frags[key] = frag
+            return frag
+        if frag == s:
+            return frag
+        # hash collision between different fragments: keep s unshared
+        return s
+
+FRAGMENT_POOL = FragmentPool()
+""" project-wide :class:`FragmentPool`, used by :class:`SVTxt` when created with ``pool = True``."""
+
+class TemplateRegistry(Mapping):
+    """ name-indexed registry of site-specific templates.
+
+    Templates are either registered in-process with :meth:`register`, or declared by
+    any installed distribution through an entry point in the ``svtmp.templates`` group::
+
+        # pyproject.toml of the site package
+        [project.entry-points."svtmp.templates"]
+        axi_slave = "mysite.axi:axi_slave"
+
+    Entry points are only discovered on the first lookup of a name that was not
+    registered in-process, and each one is only imported the first time it is looked up,
+    so importing ``svtmp`` does not pay for any installed extension.
 
-    def add(self, f : str | List[str]):
-        if isinstance(f, str):
-            self.txt += f + '\n'
+    Example::
+
+        >> from svtmp import templates
+        >> axi_slave = templates['axi_slave']   # imports mysite.axi here
+
+    Arguments:
+        group : entry point group to discover templates from.
+    """
+    def __init__(self, group: str = 'svtmp.templates'):
+        self.group = group
+        self._eps = None
+        self._loaded = {}
+
+    def register(self, name: str, template):
+        """ registers (or overrides) the template ``name``."""
+        self._loaded[name] = template
+        return template
+
+    def _entry_points(self) -> dict:
+        if self._eps is None:
+            self._eps = {}
+            try:
+                from importlib.metadata import entry_points
+            except ImportError: # python 3.7
+                try:
+                    from importlib_metadata import entry_points
+                except ImportError:
+                    return self._eps
+            eps = entry_points()
+            if hasattr(eps, 'select'):
+                eps = eps.select(group = self.group)
+            else:
+                eps = eps.get(self.group, ())
+            for ep in eps:
+                self._eps.setdefault(ep.name, ep)
+        return self._eps
+
+    def __getitem__(self, name: str):
+        try:
+            return self._loaded[name]
+        except KeyError:
+            pass
+        ep = self._entry_points().get(name)
+        if ep is None:
+            raise KeyError(f'SVTMP - no template named {name!r}')
+        template = self._loaded[name] = ep.load()
+        return template
+
+    def __contains__(self, name) -> bool:
+        return name in self._loaded or name in self._entry_points()
+
+    def __iter__(self):
+        yield from self._loaded
+        for name in self._entry_points():
+            if name not in self._loaded:
+                yield name
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+templates = TemplateRegistry()
+""" default :class:`TemplateRegistry`, populated from the ``svtmp.templates`` entry point group."""
+
+class ModuleRegistry(Mapping):
+    """ deduplication of generated modules.
+
+    Every module registered is hashed without its name, i.e. its parameters, ports and body.
+    The first module with a given content is canonical; modules registered later with the
+    same content are duplicates, and the registry maps their names to the canonical one
+    (canonical modules map to themselves), so that instantiating code can use it.
+
+    Example::
+
+        >> reg = ModuleRegistry()
+        >> for ch in range(4):
+        >>     txt = reg.module(f'chan{ch}', body, ios)   # None for duplicates
+        >>     if txt is not None:
+        >>         ...                                   # emit txt
+        >> reg['chan3']
+           'chan0'
+
+    :meth:`SVTxt.to_module` takes a ``registry`` too, in which case :meth:`SVTxt.to_sv_file`
+    and :meth:`SVTxt.to_svh_file` do not write duplicate modules.
+    """
+    def __init__(self):
+        self._digests = {}  # content digest -> canonical name
+        self._names = {}    # name -> (canonical name, digest)
+
+    @staticmethod
+    def _digest(name: str, pieces: Iterable[str]) -> bytes:
+        """ digest of a rendered module without the ``module <name>`` it starts with."""
+        import hashlib
+        h = hashlib.sha256()
+        skip = len(f'module {name}')
+        for p in pieces:
+            if skip:
+                n = min(skip, len(p))
+                p, skip = p[n:], skip - n
+            h.update(p.encode())
+        return h.digest()
+
+    def _register(self, name: str, digest: bytes) -> str:
+        prev = self._names.get(name)
+        if prev is not None:
+            if prev[1] != digest:
+                raise ValueError(f"module '{name}' already registered with a different content")
+            return prev[0]
+        canonical = self._digests.setdefault(digest, name)
+        self._names[name] = (canonical, digest)
+        return canonical
+
+    def register(self, name: str, txt: str | Iterable[str]) -> str:
+        """ registers the rendered module ``txt`` (a string, or the pieces of it) named ``name``.
+
+        Returns: the name of the canonical module with the same content.
+        """
+        return self._register(name, self._digest(name, [txt] if isinstance(txt, str) else txt))
+
+    def module(self, name: str, body: Iterable[str] | str,
+               ios:        Iterable[str] | str | None = None,
+               parameters: Iterable[str] | str | None = None,
+               imports:    Iterable[str] | str | None = None,
+               align:      bool = False) -> str | None:
+        """ same as :meth:`svtmp.module`, but returns ``None`` if an identical module
+        (other than its name) was already registered."""
+        txt = module(name, body, ios, parameters, imports, align)
+        return txt if self.register(name, txt) == name else None
+
+    def __getitem__(self, name: str) -> str:
+        return self._names[name][0]
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    @property
+    def canonical(self) -> List[str]:
+        """ names of the canonical (unique) modules, in registration order."""
+        return list(self._digests.values())
+
+_output_hooks = []
+""" functions called with the path of every file written by :meth:`SVTxt.to_sv_file` and
+:meth:`SVTxt.to_svh_file` (used by :mod:`svtmp.watch` to record what each output depends on)."""
+
+_output_sink = None
+""" object whose ``open(fname)`` returns the text stream :meth:`SVTxt.to_sv_file` and
+:meth:`SVTxt.to_svh_file` write to, instead of the file (see :class:`svtmp.bundle.Bundle`)."""
+
+def _open_output(fname: str):
+    if _output_sink is not None:
+        return _output_sink.open(fname)
+    return open(fname, 'w')
+
+def _remove(items: list, x):
+    """ removes ``x`` itself (not an equal item) from ``items``."""
+    for i, y in enumerate(items):
+        if y is x:
+            del items[i]
+            return
+
+class _FFDomain(object):
+    """ register updates of one clock/reset domain, rendered as a single ``always_ff``
+    at the place of its last :class:`_FFSlot` (after every fragment that updated it)."""
+    def __init__(self, clk: str, reset: str, elevel: bool, rlevel: bool):
+        self.key = (clk, reset, elevel, rlevel)
+        self.slots = []
+        self._txt = None
+
+    def add(self, slot: _FFSlot):
+        if self.slots:
+            self.slots[-1].invalidate()     # its block moves to the new slot
+        self.slots.append(slot)
+        self._txt = None
+        slot.invalidate()
+
+    def render(self) -> str:
+        if self._txt is None:
+            self._txt = always_ff([u for s in self.slots for u in s.rbody],
+                                  [u for s in self.slots for u in s.body], *self.key) + '\n'
+        return self._txt
+
+class _FFSlot(object):
+    """ the register updates of one :meth:`SVTxt.add_ff` call. Only the last slot of a
+    domain renders (the whole ``always_ff`` of the domain); the others are empty."""
+    __slots__ = ('domain', 'rbody', 'body', 'region')
+
+    def __init__(self, domain: _FFDomain, rbody: list, body: list, region: _Region | None):
+        self.domain = domain
+        self.rbody = rbody
+        self.body = body
+        self.region = region    # innermost region containing the slot, invalidated on changes
+
+    def invalidate(self):
+        if self.region is not None:
+            self.region.invalidate()
+
+    def render(self) -> str:
+        return self.domain.render() if self.domain.slots[-1] is self else ''
+
+class _Region(object):
+    """ a named region of an :class:`SVTxt` (see :meth:`SVTxt.region`): a list of chunks
+    whose text is cached until the region, or one of its sub-regions, changes."""
+    def __init__(self, name: str | None, chunks: list | None = None):
+        self.name = name
+        self.chunks = [] if chunks is None else chunks
+        self.parent = None
+        self.symbols = {}   # name -> declaration, of the names declared in the region
+        self._txt = None
+        for c in self.chunks:
+            if isinstance(c, _Region):
+                c.parent = self
+
+    def invalidate(self):
+        r = self
+        while r is not None:
+            r._txt = None
+            r = r.parent
+
+    def render(self) -> str:
+        if self._txt is None:
+            self._txt = ''.join([c if isinstance(c, str) else c.render() for c in self.chunks])
+        return self._txt
+
+class _Indented(_Region):
+    """ the wrapped body of :meth:`SVTxt.to_module`/:meth:`SVTxt.to_package`: the indented text
+    of its chunks. The indented text of every region is kept, and only recomputed
+    when the region text changes."""
+    def __init__(self, chunks: list):
+        nl = '\n' + INDENT
+        super().__init__(None, [c.replace('\n', nl) if isinstance(c, str) else c for c in chunks])
+        self._indented = {}
+
+    def render(self) -> str:
+        if self._txt is None:
+            nl = '\n' + INDENT
+            parts, cache = [INDENT], {}
+            for c in self.chunks:
+                if isinstance(c, str):
+                    parts.append(c)
+                    continue
+                src = c.render()
+                prev = self._indented.get(id(c))
+                if prev is None or prev[0] is not src:
+                    prev = (src, src.replace('\n', nl))
+                cache[id(c)] = prev
+                parts.append(prev[1])
+            self._indented = cache
+            self._txt = ''.join(parts)
+        return self._txt
+
+class _RegionScope(object):
+    """ context manager directing the fragments added to an :class:`SVTxt` into a region."""
+    def __init__(self, svtxt: SVTxt, region: _Region):
+        self.svtxt = svtxt
+        self.region = region
+
+    def __enter__(self):
+        t = self.svtxt
+        t._stack.append((self.region, t._chunks))
+        t._chunks = self.region.chunks
+        return self.region
+
+    def __exit__(self, *exc):
+        t = self.svtxt
+        _, t._chunks = t._stack.pop()
+        self.region.invalidate()
+        return False
+
+class _Deferred(object):
+    """ a section rendered on demand by ``func(*args, **kwargs)`` (see :meth:`SVTxt.defer`).
+    It is rendered once: the text is kept, and the function and its arguments released."""
+    def __init__(self, func, args: tuple, kwargs: dict):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._txt = None
+
+    def render(self) -> str:
+        if self._txt is None:
+            s = self.func(*self.args, **self.kwargs)
+            self._txt = s if isinstance(s, str) else '\n'.join(s)
+            self.func = self.args = self.kwargs = None
+        return self._txt
+
+def _render_shared(section: _Deferred):
+    """ renders ``section`` in a worker process. The UTF-8 text is handed back through a
+    shared memory block (python 3.8+), only its name and size are pickled back."""
+    s = section.render()
+    try:
+        from multiprocessing import shared_memory
+    except ImportError: # python 3.7
+        return s
+    data = s.encode()
+    shm = shared_memory.SharedMemory(create = True, size = max(len(data), 1))
+    try:
+        # the parent process owns (and unlinks) the block
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    except (ImportError, AttributeError):
+        pass
+    shm.buf[:len(data)] = data
+    shm.close()
+    return shm.name, len(data)
+
+def _read_shared(res) -> str:
+    if isinstance(res, str):
+        return res
+    from multiprocessing import shared_memory
+    name, size = res
+    shm = shared_memory.SharedMemory(name = name)
+    try:
+        return str(shm.buf[:size], 'utf-8')
+    finally:
+        shm.close()
+        shm.unlink()
+
+class _Spilled(object):
+    """ a run of text spilled to the temporary file of an :class:`SVTxt`: bytes ``start`` to
+    ``end`` of ``f``, with ``nl`` newlines and last character ``tail``."""
+    BLOCK = 1 << 20
+
+    def __init__(self, f, start: int, end: int, nl: int, tail: str):
+        self.f = f
+        self.start = start
+        self.end = end
+        self.nl = nl
+        self.tail = tail
+
+    def merged(self, other: _Spilled) -> _Spilled:
+        return _Spilled(self.f, self.start, other.end, self.nl + other.nl, other.tail or self.tail)
+
+    def stream(self):
+        """ yields the text in blocks of (about) :attr:`BLOCK` bytes."""
+        import codecs
+        dec = codecs.getincrementaldecoder('utf-8')()
+        pos = self.start
+        while pos < self.end:
+            n = min(self.BLOCK, self.end - pos)
+            self.f.seek(pos)
+            s = dec.decode(self.f.read(n))
+            pos += n
+            if s:
+                yield s
+
+    def render(self) -> str:
+        return ''.join(self.stream())
+
+class SVTxt(object):
+    """ SystemVerilog text accumulator.
+
+    Fragments added with :meth:`add`/:meth:`addsp` are kept as a list of chunks, and
+    only joined when the text is needed (:attr:`txt`, wrapping, or writing to file).
+
+    Declarations added (see :class:`Decl`) are kept in a symbol table, which sizes/checks
+    the literals of :meth:`eq`/:meth:`assign` (and optionally catches duplicate declarations).
+
+    Arguments:
+        pool : opt-in fragment interning. ``True`` uses :data:`FRAGMENT_POOL`, a
+               :class:`FragmentPool` instance uses that pool, ``None`` disables it.
+        coalesce_ff : merge all register updates added through :meth:`add_ff` that share
+               clock, reset, edge and level into one ``always_ff`` block per domain.
+        roll : replace regular runs of ``assign`` statements in lists passed to :meth:`add`
+               by ``generate for`` loops (see :meth:`reroll`).
+        provenance : record the Python file and line of every :meth:`add`/:meth:`addsp`/:meth:`add_ff`
+               call, and write a ``<file>.map`` sidecar (see :meth:`source_map`) next to
+               every file written by :meth:`to_sv_file`/:meth:`to_svh_file`.
+        align : align the columns of declarations, assignments and case items of every fragment
+               added, and of the ports of :meth:`to_module` (see :meth:`align_columns`).
+        unique_decls : raise a ``ValueError`` when a name is declared twice in the same scope
+               (the top level, or a :meth:`region`). Otherwise, and across scopes, the last
+               declaration of a name is the one the symbol table returns.
+        spill : memory budget (in characters) for the accumulated text. Once exceeded, the
+               text is moved to a temporary file, and wrapping (:meth:`to_module`, :meth:`to_package`,
+               :meth:`to_svh_file`) and :meth:`to_sv_file` stream from it, so memory use stays bounded.
+               Reading :attr:`txt` (or ``check = True``) still builds the whole text in memory.
+    """
+    def __init__(self, pool: FragmentPool | bool | None = None, coalesce_ff: bool = False,
+                 roll: bool = False, provenance: bool = False, spill: int | None = None,
+                 align: bool = False, unique_decls: bool = False):
+        self._chunks = []
+        self._align = align
+        self._unique = unique_decls
+        self._symbols = {}  # name -> its declarations, innermost (or last) one last
+        self._scope = {}    # name -> declaration, of the names declared at top level
+        self._regions = {}
+        self._stack = []    # (region, chunks of its parent) of the regions being filled
+        self._canonical = None  # canonical module name, when wrapped with a ModuleRegistry
+        self._module = None     # name of the module registered with the ModuleRegistry
+        self._layout = None     # (wrapped text, head length, chunks of the body) set by to_module
+        self._spill = spill
+        self._spillf = None
+        self._mem = 0       # characters held in memory since the last spill
+        if pool is True:
+            pool = FRAGMENT_POOL
+        self._pool = pool if isinstance(pool, FragmentPool) else None
+        self._coalesce_ff = coalesce_ff
+        self._roll = roll
+        self._provenance = provenance
+        self._prov = []     # (first chunk, end chunk, file, line) of pending add calls
+        self._srcmap = []   # (first line, last line, file, line) of already joined text
+        self._domains = {}
+
+    @property
+    def txt(self) -> str:
+        """ the accumulated SystemVerilog text."""
+        return ''.join(self._pieces())
+
+    @txt.setter
+    def txt(self, s: str):
+        self._set_txt(s)
+        self._symbols = {}
+        self._scope = {}
+
+    def _set_txt(self, s: str):
+        """ replaces the text, keeping the symbol table (used by the wrapping methods)."""
+        self._chunks = [self._frag(s)]
+        self._domains = {}
+        self._prov = []
+        self._srcmap = []
+        self._regions = {}
+        if self._spillf is not None:
+            self._spillf.close()
+            self._spillf = None
+        self._mem = len(s)
+        self._check_spill()
+
+    def _pieces(self):
+        """ yields the text piece by piece, reading spilled text in blocks. Deferred
+        sections rendered on the way replace their chunk, so they are rendered once."""
+        chunks = self._chunks
+        for i, c in enumerate(chunks):
+            if isinstance(c, str):
+                yield c
+            elif isinstance(c, _Spilled):
+                yield from c.stream()
+            elif isinstance(c, _Deferred):
+                s = chunks[i] = self._frag(c.render())
+                self._mem += len(s)
+                yield s
+            else:
+                yield c.render()
+
+    def _check_spill(self):
+        if self._spill is not None and self._mem > self._spill and not self._stack:
+            self._spill_chunks()
+
+    def _spill_chunks(self):
+        """ moves all string chunks to the spill file. Adjacent chunks are merged into a
+        single :class:`_Spilled` run, except at the chunk boundaries of pending provenance records."""
+        if self._spillf is None:
+            import tempfile
+            self._spillf = tempfile.TemporaryFile()
+        f = self._spillf
+        f.seek(0, 2)
+        pos = f.tell()
+        cuts = set()
+        for first, end, _, _ in self._prov:
+            cuts.update((first, end - 1, end))
+        out, remap, run = [], [], []    # run: indexes of the pending string chunks
+
+        def append(c, merge):
+            if merge and out and isinstance(out[-1], _Spilled) and out[-1].end == c.start:
+                out[-1] = out[-1].merged(c)
+            else:
+                out.append(c)
+
+        def flush():
+            nonlocal pos
+            s = ''.join([chunks[i] for i in run])
+            data = s.encode()
+            f.write(data)
+            append(_Spilled(f, pos, pos + len(data), s.count('\n'), s[-1:]), run[0] not in cuts)
+            pos += len(data)
+            for i in run:
+                remap[i] = len(out) - 1
+            run.clear()
+
+        chunks = self._chunks
+        for i, c in enumerate(chunks):
+            if isinstance(c, str):
+                if run and i in cuts:
+                    flush()
+                run.append(i)
+                remap.append(None)
+                continue
+            if run:
+                flush()
+            append(c, isinstance(c, _Spilled) and i not in cuts)
+            remap.append(len(out) - 1)
+        if run:
+            flush()
+        self._chunks = out
+        self._prov = [(remap[a], remap[e - 1] + 1, fn, ln) for a, e, fn, ln in self._prov]
+        self._mem = 0
+
+    def _rewrite(self, pieces):
+        """ replaces the text by the concatenation of ``pieces``, streamed to a new spill file."""
+        import tempfile
+        if isinstance(pieces, str):
+            pieces = [pieces]
+        f = tempfile.TemporaryFile()
+        nl, tail = 0, ''
+        for s in pieces:
+            if s:
+                f.write(s.encode())
+                nl += s.count('\n')
+                tail = s[-1]
+        old = self._spillf
+        self._chunks = [_Spilled(f, 0, f.tell(), nl, tail)]
+        self._spillf = f
+        self._domains = {}
+        self._regions = {}
+        self._prov = []
+        self._srcmap = []
+        self._mem = 0
+        if old is not None:
+            old.close()
+
+    def _record(self, first: int):
+        """ records the template call site (first frame outside svtmp) of the chunks
+        added from index ``first`` on."""
+        f = sys._getframe(2)
+        while f.f_code.co_filename == __file__ and f.f_back is not None:
+            f = f.f_back
+        self._prov.append((first, len(self._chunks), f.f_code.co_filename, f.f_lineno))
+
+    def source_map(self) -> list:
+        """ maps the lines of the current text back to the Python calls that produced them.
+
+        Only available with ``provenance = True``. Wrapping with :meth:`to_module`,
+        :meth:`to_package` or :meth:`to_svh_file` keeps the map in sync with the text.
+
+        Returns: a list of ``(first_line, last_line, file, line)`` tuples (1-based lines).
+        """
+        smap = list(self._srcmap)
+        if not self._prov:
+            return smap
+        prov = iter(self._prov)
+        first, end, fname, lineno = next(prov)
+        line, start, prev, empty = 1, None, '', True
+        for i, c in enumerate(self._chunks):
+            if i == first:
+                start, empty = line, True
+            if i == end - 1:
+                # the last chunk is the separator of add()/addsp(), not part of the fragment.
+                # empty fragments (always_ff updates emitted further down) have no lines
+                last = line - 1 if prev.endswith('\n') else line
+                if not empty:
+                    smap.append((start, max(start, last), fname, lineno))
+                nxt = next(prov, None)
+                if nxt is None:
+                    break
+                first, end, fname, lineno = nxt
+            if isinstance(c, _Spilled):
+                prev = c.tail
+                line += c.nl
+                empty = False
+            else:
+                prev = c if isinstance(c, str) else c.render()
+                line += prev.count('\n')
+                empty = empty and prev == ''
+        return smap
+
+    def _wrap(self, head: str, txt: str | Iterable[str]):
+        """ replaces the text by ``txt``, a wrapped version of it whose body starts after ``head``.
+        In spill mode ``txt`` is an iterable of pieces, streamed to a new spill file."""
+        smap = self.source_map() if self._provenance else []
+        if self._spill is not None:
+            self._rewrite(txt)
         else:
-            self.txt += '\n'.join(f) + '\n'
+            self._set_txt(txt)
+        shift = head.count('\n')
+        self._srcmap = [(a + shift, b + shift, f, l) for a, b, f, l in smap]
+
+    def _indented(self):
+        """ streaming version of ``indent(self.txt)``."""
+        nl = '\n' + INDENT
+        yield INDENT
+        for s in self._pieces():
+            yield s.replace('\n', nl)
+
+    def _write_map(self, fname: str, shift: int):
+        with _open_output(fname + '.map') as fout:
+            fout.write(f'# svtmp source map: {os.path.basename(fname)}\n')
+            for a, b, f, l in self.source_map():
+                fout.write(f'{a + shift}-{b + shift} {f}:{l}\n')
+
+    def _frag(self, s: str) -> str:
+        return self._pool.intern(s) if self._pool is not None else s
+
+    def _extend(self, f: Iterable[str] | str, end: str):
+        f = self._declared([f] if isinstance(f, str) else f)
+        if self._roll:
+            f = reroll(list(f), generate = True)
+        if self._align:
+            f = [align_columns(f)]
+        chunks = self._chunks
+        n = len(chunks)
+        for s in f:
+            chunks += [self._frag(s), '\n']
+        if len(chunks) == n:
+            chunks.append(end)
+        else:
+            chunks[-1] = end
+        if self._spill is not None:
+            self._mem += sum([len(c) for c in chunks[n:]])
+
+    def _declared(self, f: Iterable[str]):
+        """ passes the fragments of ``f`` through, adding declarations to the symbol table."""
+        for s in f:
+            if isinstance(s, Decl):
+                self._declare(s)
+            yield s
+
+    def _declare(self, d: Decl):
+        scope = self._stack[-1][0].symbols if self._stack else self._scope
+        prev = scope.get(d.name)
+        decls = self._symbols.setdefault(d.name, [])
+        if prev is not None:
+            if self._unique:
+                raise ValueError(f"'{d.name}' already declared ('{prev.strip()}')")
+            _remove(decls, prev)
+        scope[d.name] = d
+        decls.append(d)
+
+    def declare(self, decls: Decl | Iterable[Decl]):
+        """ adds declarations to the symbol table without adding any text, e.g. the ports
+        that are later passed to :meth:`to_module`.
+
+        Declarations returned by :meth:`logic`, :meth:`logvec`, :meth:`decl`, :meth:`Input`,
+        :meth:`invec`, :meth:`Output` and :meth:`outvec` are also added to the table when
+        they are passed to :meth:`add`/:meth:`addsp` (or as ports to :meth:`to_module`).
+        With ``unique_decls``, declaring the same name twice in a scope raises a ``ValueError``.
+        """
+        for d in ([decls] if isinstance(decls, str) else decls):
+            if isinstance(d, Decl):
+                self._declare(d)
+
+    def lookup(self, name: str) -> Decl | None:
+        """ returns the declaration of ``name`` (``None`` if it was not declared)."""
+        decls = self._symbols.get(name)
+        return decls[-1] if decls else None
+
+    def width(self, expr: str) -> int | None:
+        """ returns the width of a declared signal, or of a bit/part select of it
+        (``name``, ``name[i]``, ``name[7:4]``, ``name[i+:4]``), ``None`` if unknown."""
+        m = _SELECT_RE.match(expr)
+        if m is None:
+            return None
+        d = self.lookup(m.group(1))
+        if d is None or d.width is None:
+            return None
+        if m.group(2) is None:
+            return d.width
+        sl = _SLICE_RE.match(m.group(2))
+        if sl is None:
+            return None if ':' in m.group(2) else 1
+        a, b, w = sl.groups()
+        return int(w) if w is not None else abs(int(a) - int(b)) + 1
+
+    def sized(self, lhs: str, rhs: int | str, base: str = 'h') -> str:
+        """ returns ``rhs`` as the right-hand side of an assignment to ``lhs``: integers
+        become literals of the declared width of ``lhs``; literals and declared signals
+        are checked against it.
+
+        Example::
+
+            >> t = SVTxt()
+            >> t.declare(outvec('th_o', 7, 0))
+            >> t.sized('th_o', 0), t.sized('th_o[3:0]', 5, base = 'b')
+               ("8'h00", "4'b0101")
+            >> t.sized('th_o', "4'h0")
+               ValueError: 'th_o' is 8 bits wide, "4'h0" is 4 bits wide
+
+        Arguments:
+            lhs  : assigned signal, or bit/part select of it.
+            rhs  : integer value, or expression.
+            base : ``'h'`` or ``'b'``, base of the generated literals.
+
+        Returns: a string with the (sized) right-hand side.
+        """
+        w = self.width(lhs)
+        if isinstance(rhs, int) and not isinstance(rhs, bool):
+            if w is None:
+                raise ValueError(f"cannot size {rhs} for '{lhs}': unknown width")
+            if rhs < 0:
+                raise ValueError(f'{rhs} is negative')
+            return ui2h(rhs, w) if base == 'h' else ui2b(rhs, w)
+        m = _LITERAL_RE.match(rhs)
+        rw = int(m.group(1)) if m else self.width(rhs)
+        if w is not None and rw is not None and w != rw:
+            raise ValueError(f"'{lhs}' is {w} bits wide, '{rhs}' is {rw} bits wide")
+        return rhs
+
+    def eq(self, lhs: str, rhs: int | str, block: bool = False, base: str = 'h') -> str:
+        """ :meth:`svtmp.eq` with a sized and checked right-hand side (see :meth:`sized`)."""
+        return eq(lhs, self.sized(lhs, rhs, base), block)
+
+    def assign(self, lhs: str, rhs: int | str, base: str = 'h') -> str:
+        """ :meth:`svtmp.assign` with a sized and checked right-hand side (see :meth:`sized`)."""
+        return assign(lhs, self.sized(lhs, rhs, base))
+
+    def region(self, name: str) -> _RegionScope:
+        """ opens a named region: the fragments added within the ``with`` block go to the
+        region, which can later be replaced on its own with :meth:`replace`. Regions can be
+        nested, and their text is cached: after a :meth:`replace`, only the replaced region
+        and the regions containing it are joined again, also once the text has been wrapped
+        with :meth:`to_module`/:meth:`to_package`/:meth:`to_svh_file`.
+
+        Example::
+
+            >> t = SVTxt()
+            >> with t.region('regs'):
+            >>     for r in regs:
+            >>         with t.region(r.name):
+            >>             t.add(logvec(r.name, r.width - 1, 0))
+            >> t.to_module('regfile', ios)
+            >> t.replace('ctrl', logvec('ctrl', 15, 0))   # only 'ctrl' is re-rendered
+
+        Arguments:
+            name : region name, unique in the instance.
+
+        Returns: the context manager of the region.
+        """
+        if name in self._regions:
+            raise ValueError(f"region '{name}' already exists")
+        r = _Region(name)
+        if self._stack:
+            r.parent = self._stack[-1][0]
+        first = len(self._chunks)
+        # the empty chunk plays the role of the separator of add() for the source map
+        self._chunks += [r, '']
+        if self._provenance and not self._stack:
+            self._record(first)
+        self._regions[name] = r
+        return _RegionScope(self, r)
+
+    def _forget(self, r: _Region):
+        """ drops the sub-regions and the declarations of region ``r``, and the register
+        updates added in it (the rest of their ``always_ff`` blocks is kept)."""
+        for name, d in r.symbols.items():
+            decls = self._symbols.get(name, [])
+            _remove(decls, d)
+            if not decls:
+                self._symbols.pop(name, None)
+        r.symbols = {}
+        for c in r.chunks:
+            if isinstance(c, _Region):
+                if c.name is not None:
+                    self._regions.pop(c.name, None)
+                self._forget(c)
+            elif isinstance(c, _FFSlot):
+                d = c.domain
+                d.slots.remove(c)
+                d._txt = None
+                if not d.slots:
+                    del self._domains[d.key]
+                else:
+                    d.slots[-1].invalidate()
+
+    def replace(self, name: str, f: str | Iterable[str]):
+        """ replaces the content of region ``name`` by ``f`` (as :meth:`add` does), dropping
+        its sub-regions and declarations (and, with ``coalesce_ff``, the register updates
+        added in it)."""
+        r = self._regions[name]
+        self._forget(r)
+        del r.chunks[:]
+        with _RegionScope(self, r):
+            self.add(f)
+
+    def region_txt(self, name: str) -> str:
+        """ returns the (unindented) text of region ``name``."""
+        return self._regions[name].render()
+
+    def _wrap_regions(self, head: str, tail: str, indented: bool):
+        """ wraps the text between ``head`` and ``tail`` keeping its regions."""
+        smap = self.source_map() if self._provenance else []
+        body = _Indented(self._chunks) if indented else _Region(None, self._chunks)
+        for d in self._domains.values():
+            for slot in d.slots:
+                if slot.region is None:
+                    slot.region = body
+        self._chunks = [head, body, tail]
+        self._prov = []
+        shift = head.count('\n')
+        self._srcmap = [(a + shift, b + shift, f, l) for a, b, f, l in smap]
 
-    def addsp(self, f : str | List[str]):
-        if isinstance(f, str):
-            self.txt += f + ('\n'*2)
+    def sep(self, n : int = 1):
+        self._chunks.append('\n'*n)
+        self._mem += n
+        self._check_spill()
+
+    def add(self, f : str | Iterable[str]):
+        first = len(self._chunks)
+        self._extend(f, '\n')
+        if self._provenance and not self._stack:
+            self._record(first)
+        self._check_spill()
+
+    def addsp(self, f : str | Iterable[str]):
+        first = len(self._chunks)
+        self._extend(f, '\n'*2)
+        if self._provenance and not self._stack:
+            self._record(first)
+        self._check_spill()
+
+    def defer(self, func, *args, **kwargs):
+        """ adds a section rendered later by ``func(*args, **kwargs)``, which returns
+        a string or an iterable of lines.
+
+        Deferred sections are rendered in place (sequentially) when the text is needed,
+        or all at once, in parallel, by :meth:`render`. ``func`` and its arguments must be
+        picklable (i.e. ``func`` is a module level function) to render in worker processes.
+
+        Example::
+
+            >> t = SVTxt()
+            >> for i in range(4):
+            >>     t.defer(regfile_bank, i)   # regfile_bank(i) -> str
+            >> t.render(workers = 4)
+            >> t.to_module('regfile', ios)
+
+        """
+        first = len(self._chunks)
+        self._chunks += [_Deferred(func, args, kwargs), '\n']
+        if self._provenance and not self._stack:
+            self._record(first)
+
+    def render(self, workers: int | None = None, threads: bool = False):
+        """ renders all pending :meth:`defer` sections in parallel, keeping their order.
+
+        Arguments:
+            workers : number of workers (default: number of CPUs).
+            threads : use a thread pool instead of a process pool. Process workers
+                      return their text through shared memory instead of pickling it back.
+        """
+        pending = [i for i, c in enumerate(self._chunks) if isinstance(c, _Deferred)]
+        if not pending:
+            return
+        from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+        if threads:
+            with ThreadPoolExecutor(workers) as ex:
+                futures = [ex.submit(self._chunks[i].render) for i in pending]
+                results = [f.result() for f in futures]
         else:
-            self.txt += '\n'.join(f) + ('\n'*2)
+            with ProcessPoolExecutor(workers) as ex:
+                futures = [ex.submit(_render_shared, self._chunks[i]) for i in pending]
+                # collect every block, so none is left behind if one section fails
+                results = []
+                for f in futures:
+                    try:
+                        results.append(_read_shared(f.result()))
+                    except Exception as e:
+                        results.append(e)
+            for r in results:
+                if isinstance(r, Exception):
+                    raise r
+        for i, r in zip(pending, results):
+            self._chunks[i] = self._frag(r)
+            self._mem += len(r)
+        self._check_spill()
+
+    def add_ff(self, rbody: str | Iterable[str],
+               body:  str | Iterable[str],
+               clk:   str = 'clk_i',
+               reset: str = 'reset_n_i',
+               elevel: bool = True,
+               rlevel: bool = False):
+        """ adds register updates, with the same arguments as :meth:`always_ff`.
+
+        Without ``coalesce_ff`` this is ``add(always_ff(...))``. With it, the updates are
+        appended to the ``always_ff`` block of their (clk, reset, elevel, rlevel) domain,
+        which is emitted where the domain was last used (so after the declarations of all
+        its registers). Updates keep their order within each domain.
+
+        Example::
+
+            >> t = SVTxt(coalesce_ff = True)
+            >> t.add_ff(eq('a', ui2b(0,1)), eq('a', 'a_d'))
+            >> t.add_ff(eq('b', ui2b(0,1)), eq('b', 'b_d'))
+            >> print(t.txt)
+               always_ff @(posedge clk_i,negedge reset_n_i)
+               begin
+                  if (!reset_n_i)
+                  begin
+                     a <= 1'b0;
+                     b <= 1'b0;
+                  end
+                  else
+                  begin
+                     a <= a_d;
+                     b <= b_d;
+                  end
+               end
+
+        """
+        if not self._coalesce_ff:
+            self.add(always_ff(rbody, body, clk, reset, elevel, rlevel))
+            return
+        key = (clk, reset, elevel, rlevel)
+        domain = self._domains.get(key)
+        if domain is None:
+            domain = self._domains[key] = _FFDomain(*key)
+        slot = _FFSlot(domain, [rbody] if isinstance(rbody, str) else list(rbody),
+                       [body] if isinstance(body, str) else list(body),
+                       self._stack[-1][0] if self._stack else None)
+        # the slot renders its own newline: the empty chunk is the separator for the source map
+        self._chunks += [slot, '']
+        if self._provenance and not self._stack:
+            self._record(len(self._chunks) - 2)
+        domain.add(slot)
+
+    def make_always_ff(self, clk = 'clk_i', reset = 'reset_n_i', elevel = True, rlevel = False):
+        """ same as :meth:`svtmp.make_always_ff`, but the returned function adds the
+        register updates to this instance through :meth:`add_ff`."""
+        def aff(rbody, body):
+            self.add_ff(rbody, body, clk, reset, elevel, rlevel)
+        return aff
 
     def to_module(self, name : str,
-                  ios:        List[str] | str | None = None,
-                  parameters: List[str] | str | None = None,
-                  imports:    List[str] | str | None = None):
-        
-        self.txt = module(name, self.txt, ios, parameters, imports)
+                  ios:        Iterable[str] | str | None = None,
+                  parameters: Iterable[str] | str | None = None,
+                  imports:    Iterable[str] | str | None = None,
+                  registry:   ModuleRegistry | None = None,
+                  shard:      bool = False):
+        """ wraps the text into module ``name``.
+
+        With a ``registry`` (see :class:`ModuleRegistry`), the module is registered, and
+        :meth:`to_sv_file`/:meth:`to_svh_file` do not write it if it duplicates a module
+        registered before (:meth:`duplicate_of` returns the canonical module then).
+
+        With ``shard``, the top-level fragments of the body are kept until :meth:`to_sv_file`
+        splits the module into include files (see its ``shard`` argument).
+        """
+        if ios is not None and not isinstance(ios, str):
+            ios = list(ios)
+            for port in ios:
+                if isinstance(port, Decl) and self.lookup(port.name) != port:
+                    self._declare(port)
+        head = _module_head(name, ios, parameters, imports, self._align)
+        if self._regions and self._spill is None:
+            self._wrap_regions(head, '\nendmodule\n', True)
+        elif self._spill is not None:
+            self._wrap(head, chain([head], self._indented(), ['\nendmodule\n']))
+        else:
+            chunks = self._chunks
+            self._wrap(head, head + indent(self.txt) + '\nendmodule\n')
+            if shard:
+                # the chunks of the body give its top-level fragments
+                self._layout = (self._chunks[0], len(head), chunks)
+        if registry is not None:
+            self._canonical = registry.register(name, self._pieces())
+            self._module = name
+
+    def duplicate_of(self) -> str | None:
+        """ returns the canonical module this module duplicates, ``None`` if it is unique
+        (or was not wrapped with a :class:`ModuleRegistry`)."""
+        if self._canonical is None or self._canonical == self._module:
+            return None
+        return self._canonical
+
+    def _skip_duplicate(self, fname: str) -> bool:
+        dup = self.duplicate_of()
+        if dup is not None:
+            log.info(f'SVTMP - {fname} not written: same module as {dup}')
+        return dup is not None
 
 
     def to_package(self, name : str):
-        self.txt = package(name, self.txt)
-
+        head = f'package {name};\n'
+        if self._regions and self._spill is None:
+            self._wrap_regions(head, f'\nendpackage: {name}', True)
+        elif self._spill is not None:
+            self._wrap(head, chain([head], self._indented(), [f'\nendpackage: {name}']))
+        else:
+            self._wrap(head, package(name, self.txt))
+
+
+    def check(self, txt: str | None = None) -> List[str]:
+        """ runs the structural checks of :meth:`svtmp.lint.check` on the accumulated text
+        (unbalanced ``begin``/``end``, ``case``/``endcase``, ``module``/``endmodule``,
+        ``package``/``endpackage``, ```ifdef``/```endif``, duplicate declarations and ports).
+
+        Returns: a list of issue messages, empty if none was found.
+        """
+        from .lint import check
+        return check(self.txt if txt is None else txt)
+
+    def _checked(self, txt: str, check: bool) -> str:
+        if check:
+            issues = self.check(txt)
+            if issues:
+                from .lint import SVCheckError
+                raise SVCheckError(issues)
+        return txt
+
+    def _shards(self, name: str, shard: int) -> tuple:
+        """ splits the body of the module wrapped by :meth:`to_module` at top-level fragment
+        boundaries into shards of about ``shard`` characters.
+
+        Returns: (module text with the shards replaced by ``include`` lines, shard texts).
+        """
+        layout = self._layout
+        if layout is None or len(self._chunks) != 1 or self._chunks[0] is not layout[0]:
+            raise ValueError('sharding requires a module wrapped by to_module(..., shard = True) '
+                             '(without regions or spill)')
+        if shard <= 0:
+            raise ValueError(f'shard size must be positive, got {shard}')
+        wrapped, start, chunks = layout
+        tail = '\nendmodule\n'
+        body = wrapped[start + len(INDENT):-len(tail)].replace('\n' + INDENT, '\n')
+        # ends of the top-level fragments in the body
+        cuts, pos = [], 0
+        for c in chunks:
+            p = c if isinstance(c, str) else c.render()
+            pos += len(p)
+            if p.endswith('\n'):
+                cuts.append(pos)
+        shards, first = [], 0
+        for a, b in zip([0] + cuts, cuts + [len(body)]):
+            if b - first > shard and a > first:
+                shards.append(body[first:a])
+                first = a
+        shards.append(body[first:])
+        # the newline ending a shard separates it from the next include
+        shards = [sh[:-1] if sh.endswith('\n') else sh for sh in shards]
+        includes = [f'`include "{name}_{i}.svh"' for i in range(len(shards))]
+        return wrapped[:start] + indent(includes) + tail, shards
 
     def to_sv_file(self, name : str,
                    path : str = '.',
                    desc : str = '',
-                   prj : str | None = None):
-
-        fname = name + '.svh'
+                   prj : str | None = None,
+                   check: bool = False,
+                   shard: int | None = None,
+                   workers: int | None = None):
+        """ writes the text into ``<path>/<name>.sv``, with a file header.
+
+        Arguments:
+            name    : file name (without extension).
+            path    : directory of the file.
+            desc    : description in the header.
+            prj     : project name in the header.
+            check   : check the text (see :meth:`check`) before writing it.
+            shard   : split the body of the module (wrapped by :meth:`to_module` with ``shard``)
+                      at top-level fragment boundaries into ``<name>_<i>.svh`` include files of
+                      about ``shard`` characters. Shards are written in parallel (with ``workers``
+                      threads), without header, and only when their contents changed; the shards
+                      of a previous run numbered above the new ones are removed. No source map
+                      is written.
+        """
+        fname = name + '.sv'
+        if self._skip_duplicate(fname):
+            return
         
         h = header(name, fname = fname, desc = desc, prj = prj)
+        if shard is not None:
+            self._checked(self.txt, check)
+            txt, shards = self._shards(name, shard)
+            self._write_shards(name, path, shards, workers)
+            pieces = [txt]
+        elif self._spill is None or check:
+            pieces = [self._checked(self.txt, check)]
+        else:
+            pieces = self._pieces()
         
         try:
-            with open(os.path.join(path, fname), 'w') as fout:
-                print(h + '\n' + self.txt, file = fout)
+            with _open_output(os.path.join(path, fname)) as fout:
+                fout.write(h + '\n')
+                fout.writelines(pieces)
+                fout.write('\n')
+            if self._provenance and shard is None:
+                self._write_map(os.path.join(path, fname), (h + '\n').count('\n'))
+            for hook in _output_hooks:
+                hook(os.path.join(path, fname))
+            self._layout = None     # the body chunks are no longer needed
         except FileNotFoundError:
             log.error(f'SVTMP - cannot find {fname}. Exiting.')
             exit(1)
@@ -932,13 +2798,54 @@ class SVTxt(object):
             log.error(f'SVTMP - permission denied to open {fname}. Exiting.')
             exit(1)
 
+    def _unchanged(self, fname: str) -> bool:
+        """ True if file ``fname`` already holds the text (and its final newline)."""
+        try:
+            with open(fname) as f:
+                for p in chain(self._pieces(), ['\n']):
+                    if f.read(len(p)) != p:
+                        return False
+                return f.read(1) == ''
+        except (OSError, UnicodeDecodeError):
+            return False
+
+    def _write_shards(self, name: str, path: str, shards: List[str], workers: int | None):
+        def write(i):
+            t = SVTxt()
+            t.txt = shards[i]
+            t.to_svh_file(f'{name}_{i}', path, noheader = True, update = True)
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as ex:
+            list(ex.map(write, range(len(shards))))
+        if _output_sink is None:
+            # shards left over from a previous run with more of them
+            i = len(shards)
+            while os.path.exists(os.path.join(path, f'{name}_{i}.svh')):
+                os.remove(os.path.join(path, f'{name}_{i}.svh'))
+                i += 1
+
     def to_svh_file(self, name : str,
                     path : str = '.',
                     desc : str = '',
                     prj : str | None = None,
-                    noheader: bool = False):
+                    noheader: bool = False,
+                    check: bool = False,
+                    update: bool = False):
+        """ writes the text into ``<path>/<name>.svh``, with include guards and a file header.
+
+        Arguments:
+            name     : file name (without extension).
+            path     : directory of the file.
+            desc     : description in the header.
+            prj      : project name in the header.
+            noheader : do not add a file header.
+            check    : check the text (see :meth:`check`) before writing it.
+            update   : only write the file if its contents changed (keeping its modification time otherwise).
+        """
 
         fname = os.path.join(path, name + '.svh')
+        if self._skip_duplicate(fname):
+            return
         
         sguard = '_' + name.upper()+'_SVH_'
         
@@ -947,11 +2854,26 @@ class SVTxt(object):
         else:
             h = header(name = name, fname = name + '.svh', desc = desc, prj = prj)
         
-        self.txt = ifndef(sguard) + '\n' + define(sguard) +'\n\n' + h + '\n' + self.txt + '\n`endif'
+        head = ifndef(sguard) + '\n' + define(sguard) +'\n\n' + h + '\n'
+        if self._regions and self._spill is None:
+            self._wrap_regions(head, '\n`endif', False)
+            self._checked(self.txt, check)
+        elif self._spill is None or check:
+            self._wrap(head, self._checked(head + self.txt + '\n`endif', check))
+        else:
+            self._wrap(head, chain([head], self._pieces(), ['\n`endif']))
 
         try:
-            with open(fname, 'w') as fout:
-                print(self.txt, file = fout)
+            if update and _output_sink is None and self._unchanged(fname):
+                log.debug(f'SVTMP - {fname} unchanged')
+            else:
+                with _open_output(fname) as fout:
+                    fout.writelines(self._pieces())
+                    fout.write('\n')
+            if self._provenance:
+                self._write_map(fname, 0)
+            for hook in _output_hooks:
+                hook(fname)
         except FileNotFoundError:
             log.error(f'SVTMP - cannot find {fname}. Exiting.')
             exit(1)
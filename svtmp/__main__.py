@@ -0,0 +1,59 @@
+""" command line interface of svtmp::
+
+    python -m svtmp watch gen_regs.py gen_top.py
+    python -m svtmp extract rtl.tar.gz -C build
+    python -m svtmp snapshot verify rtl --diff
+
+"""
+
+import argparse
+import logging as log
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(prog = 'svtmp')
+    sub = parser.add_subparsers(dest = 'command')
+    sub.required = True
+
+    p = sub.add_parser('watch', help = 'run generator scripts, and re-run them when their inputs change')
+    p.add_argument('scripts', nargs = '+', help = 'generator scripts')
+    p.add_argument('-i', '--interval', type = float, default = 0.2, help = 'polling period in seconds')
+
+    p = sub.add_parser('extract', help = 'extract a bundle, only writing the files that changed')
+    p.add_argument('archive', help = 'tar or zip archive written by svtmp.bundle.Bundle')
+    p.add_argument('-C', '--directory', default = '.', help = 'destination directory')
+
+    p = sub.add_parser('snapshot', help = 'record or verify golden snapshots of generated files')
+    p.add_argument('action', choices = ('update', 'verify'), help = 'record the files, or compare them with the snapshot')
+    p.add_argument('root', help = 'root directory of the generated files')
+    p.add_argument('-s', '--store', default = '.svtmp_snapshot', help = 'snapshot directory')
+    p.add_argument('-t', '--text', action = 'store_true', help = '(update) also store the compressed texts, for diffs')
+    p.add_argument('-d', '--diff', action = 'store_true', help = '(verify) print the diffs of changed files')
+    p.add_argument('-j', '--workers', type = int, default = None, help = 'number of hashing threads')
+
+    args = parser.parse_args(argv)
+    log.basicConfig(level = log.INFO, format = '%(message)s')
+    if args.command == 'watch':
+        from .watch import watch
+        watch(args.scripts, args.interval)
+    elif args.command == 'extract':
+        from .bundle import extract
+        extract(args.archive, args.directory)
+    elif args.command == 'snapshot':
+        from .snapshot import Snapshot
+        snap = Snapshot(args.store)
+        if args.action == 'update':
+            snap.record(args.root, args.text, args.workers)
+            return
+        result = snap.verify(args.root, args.workers)
+        for name in result.changed:
+            d = snap.diff(args.root, name) if args.diff else None
+            print(d if d is not None else f'changed: {name}')
+        for name in result.missing:
+            print(f'missing: {name}')
+        for name in result.new:
+            print(f'new:     {name}')
+        if not result:
+            exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+"""
+Output of a whole generated project into a single archive.
+
+Inside a ``with Bundle(...)`` block, the files :meth:`svtmp.SVTxt.to_sv_file` and
+:meth:`svtmp.SVTxt.to_svh_file` write (and their source maps) are collected into one tar or zip
+archive instead of being created one by one, which saves the metadata operations of thousands
+of small files on network filesystems. Other files can be added with :meth:`Bundle.add`.
+
+The archive format follows its extension: ``.tar``, ``.tar.gz``/``.tgz``, ``.tar.bz2``,
+``.tar.xz`` or ``.zip``. Archives are reproducible: members are sorted by name, and their
+timestamps, owners and permissions are fixed.
+
+:meth:`extract` (``python -m svtmp extract``) unpacks an archive, only writing the files whose
+contents changed, so that unchanged outputs keep their modification time and do not trigger
+downstream rebuilds.
+
+Example::
+
+    >> from svtmp.bundle import Bundle, extract
+    >> with Bundle('rtl.tar.gz'):
+    >>     for name, t in generated.items():
+    >>         t.to_sv_file(name, 'rtl')       # member rtl/<name>.sv
+    >> extract('rtl.tar.gz')
+
+    $ python -m svtmp extract rtl.tar.gz -C build
+
+"""
+
+import gzip
+import io
+import logging as log
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import zipfile
+import svtmp
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import List
+
+_FORMATS = [('.tar.gz', 'gz'), ('.tgz', 'gz'), ('.tar.bz2', 'bz2'), ('.tar.xz', 'xz'),
+            ('.tar', 'tar'), ('.zip', 'zip')]
+_ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)  # earliest zip timestamp
+
+def _format(fname: str) -> str:
+    for ext, fmt in _FORMATS:
+        if fname.endswith(ext):
+            return fmt
+    raise ValueError(f'unsupported archive extension: {fname} '
+                     f'(expected one of {", ".join([e for e, _ in _FORMATS])})')
+
+class _Member(io.TextIOBase):
+    """ text stream of a bundle member, spooled to memory (or to disk once large)."""
+    def __init__(self, bundle: Bundle, name: str):
+        self._bundle = bundle
+        self._name = name
+        self._data = tempfile.SpooledTemporaryFile(max_size = 1 << 20)
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        self._data.write(s.encode())
+        return len(s)
+
+    def close(self):
+        if not self.closed:
+            self._bundle._store(self._name, self._data)
+            self._data.close()
+        super().close()
+
+class Bundle(object):
+    """ archive collecting the outputs of a generator run.
+
+    Used as a context manager, it captures the files written by :class:`svtmp.SVTxt` in
+    the block, and writes the archive when the block exits without an exception.
+    Member contents are stored in a local temporary file until then, so the archive is
+    created in one go, in sorted order, whatever the order (or thread) the files were written in.
+
+    Arguments:
+        fname : archive file name; its extension selects the format and compression.
+        root  : directory member names are relative to (files outside of it are rejected).
+    """
+    def __init__(self, fname: str, root: str = '.'):
+        self.fname = fname
+        self.format = _format(fname)
+        self.root = os.path.abspath(root)
+        self._members = {}  # name -> (offset, size) in the store
+        self._store_f = tempfile.TemporaryFile()
+        self._lock = threading.Lock()
+        self._prev = None
+
+    def _name(self, fname: str) -> str:
+        name = os.path.relpath(os.path.abspath(fname), self.root)
+        if name == '..' or name.startswith('..' + os.sep):
+            raise ValueError(f'{fname} is outside of the bundle root {self.root}')
+        return name.replace(os.sep, '/')
+
+    def open(self, fname: str) -> _Member:
+        """ returns a text stream whose contents become member ``fname`` when closed."""
+        return _Member(self, self._name(fname))
+
+    def add(self, fname: str, data: str | bytes):
+        """ adds member ``fname`` with contents ``data``."""
+        with self.open(fname) as f:
+            if isinstance(data, bytes):
+                f._data.write(data)
+            else:
+                f.write(data)
+
+    def _store(self, name: str, data):
+        data.seek(0)
+        with self._lock:
+            if name in self._members:
+                raise ValueError(f'{name} written twice into bundle {self.fname}')
+            offset = self._store_f.seek(0, os.SEEK_END)
+            shutil.copyfileobj(data, self._store_f)
+            self._members[name] = (offset, self._store_f.tell() - offset)
+
+    @property
+    def names(self) -> List[str]:
+        """ sorted names of the members collected so far."""
+        return sorted(self._members)
+
+    def _copy(self, offset: int, size: int, dst):
+        self._store_f.seek(offset)
+        while size:
+            buf = self._store_f.read(min(size, 1 << 20))
+            dst.write(buf)
+            size -= len(buf)
+
+    def _write_tar(self, raw):
+        gz = None
+        if self.format == 'gz':
+            # the gzip header holds a timestamp and file name, fixed for reproducibility
+            gz = raw = gzip.GzipFile(filename = '', mode = 'wb', fileobj = raw, mtime = 0)
+        mode = 'w' if self.format in ('gz', 'tar') else f'w:{self.format}'
+        with tarfile.open(fileobj = raw, mode = mode, format = tarfile.PAX_FORMAT) as tar:
+            for name in self.names:
+                offset, size = self._members[name]
+                info = tarfile.TarInfo(name)
+                info.size, info.mode = size, 0o644
+                self._store_f.seek(offset)
+                tar.addfile(info, self._store_f)
+        if gz is not None:
+            gz.close()
+
+    def _write_zip(self, raw):
+        with zipfile.ZipFile(raw, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for name in self.names:
+                offset, size = self._members[name]
+                info = zipfile.ZipInfo(name, _ZIP_EPOCH)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.external_attr = 0o644 << 16
+                info.file_size = size
+                with zf.open(info, 'w') as dst:
+                    self._copy(offset, size, dst)
+
+    def close(self):
+        """ writes the archive (atomically: it is written to a temporary file first)."""
+        if self._store_f.closed:
+            return
+        tmp = f'{self.fname}.{os.getpid()}.tmp'
+        try:
+            with open(tmp, 'wb') as raw:
+                if self.format == 'zip':
+                    self._write_zip(raw)
+                else:
+                    self._write_tar(raw)
+            os.replace(tmp, self.fname)
+        except (FileNotFoundError, PermissionError) as e:
+            log.error(f'SVTMP - cannot write {self.fname}: {e.strerror}. Exiting.')
+            exit(1)
+        finally:
+            self._store_f.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        log.info(f'SVTMP - {len(self._members)} files written into {self.fname}')
+
+    def __enter__(self) -> Bundle:
+        self._prev, svtmp._output_sink = svtmp._output_sink, self
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        svtmp._output_sink = self._prev
+        if exc_type is None:
+            self.close()
+        else:
+            self._store_f.close()
+
+def _target(dest: str, name: str) -> str:
+    parts = name.split('/')
+    if name.startswith('/') or '..' in parts:
+        raise ValueError(f'unsafe member name in archive: {name}')
+    return os.path.join(dest, *parts)
+
+def extract(fname: str, dest: str = '.') -> List[str]:
+    """ extracts archive ``fname`` (as written by :class:`Bundle`) into ``dest``, only
+    writing the files that do not exist or whose contents differ.
+
+    Arguments:
+        fname : archive (tar, possibly compressed, or zip).
+        dest  : destination directory.
+
+    Returns: the list of (re)written files.
+    """
+    written = []
+
+    def update(name: str, size: int, read):
+        path = _target(dest, name)
+        data = None
+        try:
+            # files of a different size are rewritten without being read
+            if os.stat(path).st_size == size:
+                data = read()
+                with open(path, 'rb') as f:
+                    if f.read() == data:
+                        return
+        except OSError:
+            pass
+        if data is None:
+            data = read()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok = True)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        written.append(path)
+
+    try:
+        if _format(fname) == 'zip':
+            with zipfile.ZipFile(fname) as zf:
+                for info in zf.infolist():
+                    if not info.is_dir():
+                        update(info.filename, info.file_size, lambda: zf.read(info))
+        else:
+            with tarfile.open(fname) as tar:
+                for info in tar:
+                    if info.isfile():
+                        update(info.name, info.size, lambda: tar.extractfile(info).read())
+    except FileNotFoundError:
+        log.error(f'SVTMP - cannot find {fname}. Exiting.')
+        exit(1)
+    except PermissionError:
+        log.error(f'SVTMP - permission denied to open {fname}. Exiting.')
+        exit(1)
+    log.info(f'SVTMP - {len(written)} files updated from {fname}')
+    return written
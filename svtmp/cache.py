@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+"""
+Persistent on-disk memoisation of template calls.
+
+:meth:`memoize` wraps a pure function (an svtmp template, or a user generator function built
+on them) so that its results are stored in a :class:`DiskCache` and reused by later runs,
+e.g. by repeated CI jobs.
+
+Results are keyed by a stable hash of:
+
+* the function (module, qualified name and compiled code, so editing it invalidates its entries,
+  but not moving it: file names and line numbers are not part of the key), the values of the
+  variables it closes over, and the function and arguments bound by a ``functools.partial``,
+* its arguments: ``None``, ``bool``, ``int``, ``float``, ``str``, ``bytes``, and tuples, lists,
+  dictionaries and sets of them. Other arguments raise a ``TypeError``,
+* the svtmp version and sources, and the style settings (:data:`svtmp.INDENT`).
+
+Global variables and the functions called by a memoized function are only keyed by name: a
+memoized function must not depend on mutable globals, and editing a helper it calls (outside of
+svtmp) does not invalidate its entries.
+
+The cache directory is ``$SVTMP_CACHE_DIR`` (default ``~/.cache/svtmp``). When it grows above
+its size budget, the least recently used entries are evicted.
+
+Example::
+
+    >> from svtmp import *
+    >> from svtmp.cache import memoize
+    >> big_case = memoize(case)       # template call, cached on disk
+    >> @memoize
+    >> def regfile(n):                # user generator function
+    >>     return always_comb([eq(f'q[{i}]', f'd[{i}]') for i in range(n)])
+
+"""
+
+import hashlib
+import os
+import pickle
+import struct
+from functools import partial, wraps
+import svtmp
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Any, Callable
+
+_MISS = object()
+
+def _canon(obj, out: list):
+    """ appends an unambiguous byte encoding of ``obj`` to ``out``."""
+    t = type(obj)
+    if obj is None or t is bool:
+        out.append(b'N' if obj is None else b'T' if obj else b'F')
+    elif isinstance(obj, int):
+        s = str(int(obj)).encode()
+        out += [b'i', struct.pack('<I', len(s)), s]
+    elif isinstance(obj, float):
+        out += [b'f', struct.pack('<d', obj)]
+    elif isinstance(obj, str):
+        s = obj.encode('utf-8', 'surrogatepass')
+        out += [b's', struct.pack('<I', len(s)), s]
+    elif isinstance(obj, (bytes, bytearray)):
+        out += [b'b', struct.pack('<I', len(obj)), bytes(obj)]
+    elif isinstance(obj, (tuple, list)):
+        out += [b't' if isinstance(obj, tuple) else b'l', struct.pack('<I', len(obj))]
+        for v in obj:
+            _canon(v, out)
+    elif isinstance(obj, dict):
+        items = []
+        for k, v in obj.items():
+            kv = []
+            _canon(k, kv)
+            _canon(v, kv)
+            items.append(b''.join(kv))
+        out += [b'd', struct.pack('<I', len(items))] + sorted(items)
+    elif isinstance(obj, (set, frozenset)):
+        items = []
+        for v in obj:
+            kv = []
+            _canon(v, kv)
+            items.append(b''.join(kv))
+        out += [b'e', struct.pack('<I', len(items))] + sorted(items)
+    else:
+        raise TypeError(f'cannot build a stable cache key from a value of type {t.__name__}')
+
+_svtmp_id = None
+
+def _version() -> bytes:
+    """ svtmp version and a digest of its sources (every ``svtmp/*.py``)."""
+    global _svtmp_id
+    if _svtmp_id is None:
+        h = hashlib.sha256()
+        try:
+            from importlib.metadata import version, PackageNotFoundError
+            try:
+                h.update(version('svtmp').encode())
+            except PackageNotFoundError:
+                pass
+        except ImportError: # python 3.7
+            pass
+        src = os.path.dirname(svtmp.__file__)
+        for fname in sorted(os.listdir(src)):
+            if fname.endswith('.py'):
+                with open(os.path.join(src, fname), 'rb') as f:
+                    h.update(fname.encode() + b'\0' + f.read())
+        _svtmp_id = h.digest()
+    return _svtmp_id
+
+def _code(code, out: list):
+    """ appends the encoding of a code object without its location (file name, line numbers),
+    so that the same function checked out in different places gets the same key."""
+    out += [b'c', code.co_code, code.co_qualname.encode() if hasattr(code, 'co_qualname') else code.co_name.encode()]
+    _canon(code.co_names, out)
+    _canon(code.co_varnames, out)
+    out.append(struct.pack('<III', code.co_argcount, code.co_kwonlyargcount, code.co_flags))
+    consts = []
+    for c in code.co_consts:
+        if hasattr(c, 'co_code'):   # nested function, lambda or comprehension
+            _code(c, out)
+        else:
+            consts.append(c)
+    enc = []
+    try:
+        _canon(tuple(consts), enc)
+    except TypeError:               # constants without a stable encoding (e.g. Ellipsis)
+        enc = [repr(consts).encode()]
+    out += enc
+
+def _func(func: Callable, out: list, seen: set):
+    """ appends the encoding of a function: its name, code and closure, or, for a
+    ``functools.partial``, the wrapped function and the bound arguments."""
+    if isinstance(func, partial):
+        out.append(b'p')
+        _func(func.func, out, seen)
+        _canon(func.args, out)
+        _canon(func.keywords, out)
+        return
+    name = getattr(func, '__qualname__', None)
+    if name is None:
+        raise TypeError(f'cannot build a stable cache key from a callable of type {type(func).__name__}')
+    out.append(f'{func.__module__}.{name}'.encode())
+    code = getattr(func, '__code__', None)
+    if code is None or id(func) in seen:    # builtin, or recursive closure
+        return
+    seen.add(id(func))
+    _code(code, out)
+    for cell in func.__closure__ or ():
+        try:
+            v = cell.cell_contents
+        except ValueError:  # not assigned yet
+            out.append(b'u')
+            continue
+        if callable(v) and not isinstance(v, type):
+            _func(v, out, seen)
+        else:
+            _canon(v, out)
+
+def key(func: Callable, args: tuple, kwargs: dict) -> str:
+    """ returns the cache key of the call ``func(*args, **kwargs)``."""
+    out = [_version(), svtmp.INDENT.encode()]
+    _func(func, out, set())
+    _canon(args, out)
+    _canon(kwargs, out)
+    return hashlib.sha256(b'\0'.join(out)).hexdigest()
+
+class DiskCache(object):
+    """ size-bounded directory of cached results, evicted in least recently used order.
+
+    Arguments:
+        path     : cache directory (created if needed). Default: ``$SVTMP_CACHE_DIR``,
+                   or ``~/.cache/svtmp``.
+        max_size : size budget in bytes. Once exceeded, the least recently used entries are
+                   removed until the cache is below 3/4 of it.
+    """
+    def __init__(self, path: str | None = None, max_size: int = 256 << 20):
+        if path is None:
+            path = os.environ.get('SVTMP_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'svtmp')
+        if max_size <= 0:
+            raise ValueError(f'max_size must be positive, got {max_size}')
+        self.path = path
+        self.max_size = max_size
+        self._size = None   # total size of the entries, computed on the first store
+        os.makedirs(path, exist_ok = True)
+
+    def _entry(self, k: str) -> str:
+        return os.path.join(self.path, k)
+
+    def get(self, k: str, default = None) -> Any:
+        """ returns the value stored under key ``k`` (``default`` if there is none)."""
+        fname = self._entry(k)
+        try:
+            with open(fname, 'rb') as f:
+                data = f.read()
+            os.utime(fname)     # the modification time orders entries for eviction
+        except OSError:
+            return default
+        if data[:1] == b'S':
+            return data[1:].decode()
+        try:
+            return pickle.loads(data[1:])
+        except Exception:
+            return default
+
+    def put(self, k: str, value: Any):
+        """ stores ``value`` (a string, or any picklable object) under key ``k``."""
+        if isinstance(value, str):
+            data = b'S' + value.encode()
+        else:
+            data = b'P' + pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        fname = self._entry(k)
+        try:
+            old = os.stat(fname).st_size     # size of the entry replaced
+        except OSError:
+            old = 0
+        tmp = f'{fname}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, fname)
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += len(data) - old
+        if self._size > self.max_size:
+            self.evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for e in os.scandir(self.path):
+            if e.is_file() and not e.name.endswith('.tmp'):
+                try:
+                    st = e.stat()
+                except OSError:     # removed by another process
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, e.path))
+        return entries
+
+    def size(self) -> int:
+        """ total size of the cached entries, in bytes."""
+        return sum([s for _, s, _ in self._entries()])
+
+    def evict(self, target: int | None = None):
+        """ removes the least recently used entries until the cache is below ``target``
+        bytes (default: 3/4 of ``max_size``)."""
+        if target is None:
+            target = self.max_size * 3 // 4
+        entries = sorted(self._entries())
+        size = sum([s for _, s, _ in entries])
+        for _, s, fname in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(fname)
+            except OSError:
+                pass
+            size -= s
+        self._size = size
+
+    def clear(self):
+        """ removes all entries."""
+        self.evict(0)
+
+_default = None
+
+def default_cache() -> DiskCache:
+    """ returns the :class:`DiskCache` used by :meth:`memoize` when none is given."""
+    global _default
+    if _default is None:
+        _default = DiskCache()
+    return _default
+
+def memoize(func: Callable | None = None, cache: DiskCache | None = None) -> Callable:
+    """ decorator storing the results of ``func`` in a :class:`DiskCache`.
+
+    Can be used as ``@memoize``, ``@memoize(cache = DiskCache(path))`` or ``memoize(case)``.
+
+    Arguments:
+        func  : pure function, whose result depends only on its arguments (and the values
+                it closes over, see the module documentation).
+        cache : cache to use (default: :meth:`default_cache`).
+
+    Returns: the wrapped function.
+    """
+    if func is None:
+        return lambda f: memoize(f, cache)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        c = cache if cache is not None else default_cache()
+        k = key(func, args, kwargs)
+        value = c.get(k, _MISS)
+        if value is _MISS:
+            value = func(*args, **kwargs)
+            c.put(k, value)
+        return value
+    return wrapper
@@ -0,0 +1,209 @@
+from __future__ import annotations
+
+"""
+Encoder/decoder generators built on the :mod:`svtmp` templates.
+
+Every generator returns a complete process: an ``always_comb`` block by default, or an
+``always_ff`` block when an ``aff`` function created with :meth:`svtmp.make_always_ff`
+is given (the reset body clears the output). Each one can render either:
+
+* the unrolled form (``loop = False``): one ``case`` item (or statement) per input value/bit.
+* the compact form (``loop = True``): a single procedural ``for`` loop.
+
+Literals are built by slicing precomputed ``'0'``/``'1'`` strings instead of converting
+ever-larger integers, so construction time is linear in the size of the generated text
+(and constant per item for the loop form), which keeps widths of a few thousand bits cheap.
+
+Example::
+
+    >> from svtmp import *
+    >> from svtmp.encoders import bin2th
+    >> t = SVTxt()
+    >> t.add(bin2th('sel_i', 'th_o', iw = 4, aff = make_always_ff()))
+
+"""
+
+from svtmp import always_comb, case, citem, eq, For, If, ui2h
+
+def _clog2(n: int) -> int:
+    return max(1, (n - 1).bit_length())
+
+def _process(body: str | list, dout: str, aff) -> str:
+    if aff is None:
+        body = [body] if isinstance(body, str) else body
+        return always_comb([eq(dout, "'0", block = True)] + body)
+    return aff(eq(dout, "'0"), body)
+
+def bin2th(din: str, dout: str, iw: int, ow: int | None = None, loop: bool = False, aff = None) -> str:
+    """ binary to thermometer encoder: ``din == i`` sets the ``i+1`` lower bits of ``dout``.
+    Input values beyond the output width saturate ``dout`` to all ones.
+
+    Example::
+
+        >> print(bin2th('sel_i', 'th_o', 2))
+           always_comb
+           begin
+              th_o = '0;
+              case(sel_i)
+                 2'h0:    th_o = 4'b0001;
+                 2'h1:    th_o = 4'b0011;
+                 2'h2:    th_o = 4'b0111;
+                 2'h3:    th_o = 4'b1111;
+              endcase
+
+           end
+
+    Arguments:
+        din  : binary input name.
+        dout : thermometer output name.
+        iw   : input width.
+        ow   : output width (``2**iw`` if ``None``).
+        loop : render a for loop instead of the unrolled case.
+        aff  : ``always_ff`` generator from :meth:`svtmp.make_always_ff` (``None`` for ``always_comb``).
+
+    Returns: a string with the encoder process.
+    """
+    ow = 2**iw if ow is None else ow
+    if ow > 2**iw:
+        raise ValueError(f'{ow} thermometer bits cannot be encoded from {iw} bits')
+    blk = aff is None
+    if loop:
+        body = For('i', 0, ow, eq(f'{dout}[i]', f'i <= {din}', blk))
+    else:
+        zeros, ones = ow * '0', ow * '1'
+        items = [citem(ui2h(i, iw), eq(dout, f"{ow}'b{zeros[i+1:]}{ones[:i+1]}", blk)) for i in range(ow)]
+        if ow < 2**iw:
+            items.append(citem('default', eq(dout, "'1", blk)))
+        body = case(din, items)
+    return _process(body, dout, aff)
+
+def bin2oh(din: str, dout: str, iw: int, ow: int | None = None, loop: bool = False, aff = None) -> str:
+    """ binary decoder: ``din == i`` sets bit ``i`` of the one-hot output ``dout``.
+    Input values beyond the output width clear ``dout``.
+
+    Arguments:
+        din  : binary input name.
+        dout : one-hot output name.
+        iw   : input width.
+        ow   : output width (``2**iw`` if ``None``).
+        loop : render a for loop instead of the unrolled case.
+        aff  : ``always_ff`` generator from :meth:`svtmp.make_always_ff` (``None`` for ``always_comb``).
+
+    Returns: a string with the decoder process.
+    """
+    ow = 2**iw if ow is None else ow
+    if ow > 2**iw:
+        raise ValueError(f'{ow} one-hot bits cannot be decoded from {iw} bits')
+    blk = aff is None
+    if loop:
+        body = For('i', 0, ow, eq(f'{dout}[i]', f'{din} == i', blk))
+    else:
+        zeros = ow * '0'
+        items = [citem(ui2h(i, iw), eq(dout, f"{ow}'b{zeros[i+1:]}1{zeros[:i]}", blk)) for i in range(ow)]
+        if ow < 2**iw:
+            items.append(citem('default', eq(dout, "'0", blk)))
+        body = case(din, items)
+    return _process(body, dout, aff)
+
+def oh2bin(din: str, dout: str, iw: int, loop: bool = False, aff = None) -> str:
+    """ one-hot to binary encoder: bit ``i`` of ``din`` set encodes ``i`` into ``dout``
+    (``clog2(iw)`` bits wide). Non one-hot inputs are undefined for the loop form and
+    clear ``dout`` for the unrolled form.
+
+    Arguments:
+        din  : one-hot input name.
+        dout : binary output name.
+        iw   : input width.
+        loop : render a for loop instead of the unrolled case.
+        aff  : ``always_ff`` generator from :meth:`svtmp.make_always_ff` (``None`` for ``always_comb``).
+
+    Returns: a string with the encoder process.
+    """
+    ow = _clog2(iw)
+    blk = aff is None
+    if loop:
+        body = For('i', 0, iw, If(f'{din}[i]', eq(dout, 'i', blk)))
+        if not blk:
+            # the reset value only covers the reset branch of the always_ff
+            body = [eq(dout, "'0"), body]
+    else:
+        zeros = iw * '0'
+        items = [citem(f"{iw}'b{zeros[i+1:]}1{zeros[:i]}", eq(dout, ui2h(i, ow), blk)) for i in range(iw)]
+        items.append(citem('default', eq(dout, "'0", blk)))
+        body = case(din, items)
+    return _process(body, dout, aff)
+
+def prio_enc(din: str, dout: str, iw: int, msb: bool = False, loop: bool = False, aff = None) -> str:
+    """ priority encoder: ``dout`` (``clog2(iw)`` bits wide) is the index of the lowest
+    (``msb = False``) or highest (``msb = True``) bit set in ``din``, and 0 if none is set.
+
+    Arguments:
+        din  : input name.
+        dout : binary output name.
+        iw   : input width.
+        msb  : most significant bit has the highest priority.
+        loop : render a for loop instead of the unrolled casez.
+        aff  : ``always_ff`` generator from :meth:`svtmp.make_always_ff` (``None`` for ``always_comb``).
+
+    Returns: a string with the encoder process.
+    """
+    ow = _clog2(iw)
+    blk = aff is None
+    if loop:
+        # the last assignment wins: scan towards the highest priority bit
+        start, stop, step = (0, iw, 1) if msb else (iw - 1, -1, -1)
+        body = For('i', start, stop, If(f'{din}[i]', eq(dout, 'i', blk)), step = step)
+        if not blk:
+            # the reset value only covers the reset branch of the always_ff: 0 if no bit is set
+            body = [eq(dout, "'0"), body]
+    else:
+        zeros, dcs = iw * '0', iw * '?'
+        if msb:
+            keys = (f"{iw}'b{zeros[i+1:]}1{dcs[:i]}" for i in range(iw))
+        else:
+            keys = (f"{iw}'b{dcs[i+1:]}1{zeros[:i]}" for i in range(iw))
+        items = [citem(k, eq(dout, ui2h(i, ow), blk)) for i, k in enumerate(keys)]
+        items.append(citem('default', eq(dout, "'0", blk)))
+        body = case(din, items, kind = 'casez')
+    return _process(body, dout, aff)
+
+def bin2gray(din: str, dout: str, w: int, loop: bool = False, aff = None) -> str:
+    """ binary to gray code converter (``w`` bits wide).
+
+    Arguments:
+        din  : binary input name.
+        dout : gray output name.
+        w    : input/output width.
+        loop : render a for loop instead of one statement per bit.
+        aff  : ``always_ff`` generator from :meth:`svtmp.make_always_ff` (``None`` for ``always_comb``).
+
+    Returns: a string with the converter process.
+    """
+    blk = aff is None
+    msb = eq(f'{dout}[{w-1}]', f'{din}[{w-1}]', blk)
+    if loop:
+        body = [msb, For('i', 0, w - 1, eq(f'{dout}[i]', f'{din}[i+1] ^ {din}[i]', blk))]
+    else:
+        body = [msb] + [eq(f'{dout}[{i}]', f'{din}[{i+1}] ^ {din}[{i}]', blk) for i in range(w - 2, -1, -1)]
+    return _process(body, dout, aff)
+
+def gray2bin(din: str, dout: str, w: int, loop: bool = False, aff = None) -> str:
+    """ gray code to binary converter (``w`` bits wide). Each output bit is the
+    reduction xor of the input bits above it, so the result is the same for blocking
+    and non-blocking assignments.
+
+    Arguments:
+        din  : gray input name.
+        dout : binary output name.
+        w    : input/output width.
+        loop : render a for loop instead of one statement per bit.
+        aff  : ``always_ff`` generator from :meth:`svtmp.make_always_ff` (``None`` for ``always_comb``).
+
+    Returns: a string with the converter process.
+    """
+    blk = aff is None
+    if loop:
+        body = For('i', 0, w, eq(f'{dout}[i]', f'^({din} >> i)', blk))
+    else:
+        body = [eq(f'{dout}[{i}]', f'^{din}[{w-1}:{i}]', blk) for i in range(w - 1, -1, -1)]
+    return _process(body, dout, aff)
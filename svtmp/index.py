@@ -0,0 +1,345 @@
+from __future__ import annotations
+
+"""
+Index of the module headers of existing RTL trees.
+
+:class:`RTLIndex` scans a directory tree of SystemVerilog files and extracts the name,
+parameters and ports of every module, so that generated top levels can instantiate
+hand-written modules without copying their port lists by hand. Ports are returned as the
+strings :meth:`svtmp.Input`/:meth:`svtmp.invec`/:meth:`svtmp.Output`/:meth:`svtmp.outvec`
+produce, and parameters as ``parameter`` declarations, ready for :meth:`svtmp.module`.
+
+Files are read through ``mmap``: only comments and module headers are tokenised, and module
+bodies are skipped up to their ``endmodule``. The index can be saved to a file; a later
+:meth:`RTLIndex.refresh` only rescans the files whose modification time or size changed.
+
+Only ANSI style headers get typed ports: non-ANSI port lists are returned as bare names.
+
+Example::
+
+    >> from svtmp.index import RTLIndex
+    >> idx = RTLIndex('rtl', index_file = '.rtl_index')
+    >> idx['sync_fifo']['ports']
+       ['input logic clk_i', 'input logic [7:0] data_i', 'output logic full_o']
+    >> idx['sync_fifo']['parameters']
+       ['parameter int DEPTH = 16']
+
+"""
+
+import json
+import logging as log
+import mmap
+import os
+import re
+from collections.abc import Mapping
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable, List
+
+INDEX_VERSION = 1
+
+# comments and strings (skipped), and module keywords. Every alternative starts with a
+# literal, so that the search skips ahead to the next '/', '"' or 'm'
+_MODULE_RE = re.compile(rb'//[^\n]*|/\*.*?\*/|"(?:\\.|[^"\\\n])*"|m(?:acromodule|odule)\b', re.S)
+_WORD = frozenset(b'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_$')
+_HEADER_RE = re.compile(rb'//[^\n]*|/\*.*?\*/|[()\[\]{};]', re.S)
+_NAME_RE = re.compile(r'\s*(?:(?:automatic|static)\s+)?([A-Za-z_][\w$]*)')
+_ID_RE = re.compile(r'[A-Za-z_][\w$]*(?:::[A-Za-z_][\w$]*)?(?:\.[A-Za-z_][\w$]*)?')
+_DIRECTIONS = {'input', 'output', 'inout', 'ref'}
+
+def _header(mm, pos: int):
+    """ returns the text (without comments) from ``pos`` to the ``;`` ending the module
+    header, and the position after it."""
+    parts, depth, start = [], 0, pos
+    for m in _HEADER_RE.finditer(mm, pos):
+        tok = m.group()
+        if tok[:1] == b'/':
+            parts.append(mm[start:m.start()])
+            parts.append(b' ')
+            start = m.end()
+        elif tok in b'([{':
+            depth += 1
+        elif tok in b')]}':
+            depth -= 1
+        elif depth == 0:
+            text = b''.join(parts + [mm[start:m.start()]]).decode('utf-8', 'replace')
+            # ';' ending package imports before the parameter/port lists
+            if re.search(r'\bimport\b[^#(]*$', text):
+                continue
+            return text, m.end()
+    return None, len(mm)
+
+def _split(s: str) -> List[str]:
+    """ splits ``s`` on the commas that are not nested in brackets."""
+    items, depth, start = [], 0, 0
+    for i, c in enumerate(s):
+        if c in '([{':
+            depth += 1
+        elif c in ')]}':
+            depth -= 1
+        elif c == ',' and depth == 0:
+            items.append(s[start:i])
+            start = i + 1
+    items.append(s[start:])
+    return [' '.join(i.split()) for i in items if i.strip()]
+
+def _balanced(s: str, i: int) -> int:
+    """ returns the index of the parenthesis closing the one at ``s[i]``."""
+    depth = 0
+    for j in range(i, len(s)):
+        if s[j] == '(':
+            depth += 1
+        elif s[j] == ')':
+            depth -= 1
+            if depth == 0:
+                return j
+    return len(s)
+
+def _dims(s: str):
+    """ splits the leading ``[...]`` dimensions of ``s``: returns (dimensions, rest)."""
+    dims = []
+    s = s.strip()
+    while s.startswith('['):
+        j = s.find(']')
+        if j < 0:
+            break
+        dims.append(' '.join(s[:j + 1].split()).replace(' ', ''))
+        s = s[j + 1:].strip()
+    return dims, s
+
+def _ports(items: List[str]) -> List[str]:
+    ports, prev = [], None
+    for item in items:
+        item = item.split('=', 1)[0].strip()
+        words = []
+        rest = item
+        while True:
+            dims, rest = _dims(rest)
+            words += dims
+            m = _ID_RE.match(rest)
+            if not m:
+                break
+            words.append(m.group())
+            rest = rest[m.end():]
+        unpacked = []
+        # the port name is the last identifier: following dimensions are unpacked
+        while words and words[-1].startswith('['):
+            unpacked.insert(0, words.pop())
+        if not words:
+            continue
+        name = words.pop()
+        direction = words.pop(0) if words and words[0] in _DIRECTIONS else None
+        if direction is None and (prev is None or (words and '.' in words[0])):
+            # non-ANSI port list (bare names) or interface ports
+            ports.append(' '.join(words + [name] + unpacked))
+            prev = None
+            continue
+        if direction is None and not words:
+            direction, words = prev
+        elif direction is None:
+            direction = prev[0]
+        if not words or words[0].startswith('['):
+            if not (words and words[0] in ('signed', 'unsigned')):
+                words.insert(0, 'logic')
+        prev = (direction, words)
+        ports.append(' '.join([direction] + words + [name] + unpacked))
+    return ports
+
+def _parameters(items: List[str]) -> List[str]:
+    params, kw = [], 'parameter'
+    for item in items:
+        first = item.split(' ', 1)[0]
+        if first in ('parameter', 'localparam'):
+            kw = first
+            params.append(item)
+        else:
+            params.append(f'{kw} {item}')
+    return params
+
+def _parse(text: str):
+    """ parses a module header (from after the ``module`` keyword to before its ``;``)."""
+    m = _NAME_RE.match(text)
+    if not m:
+        return None
+    name, rest = m.group(1), text[m.end():]
+    # skip package imports
+    rest = re.sub(r'\bimport\b[^;]*;', ' ', rest).strip()
+    params, ports = [], []
+    if rest.startswith('#'):
+        i = rest.find('(')
+        if i < 0:
+            return None
+        j = _balanced(rest, i)
+        params = _parameters(_split(rest[i + 1:j]))
+        rest = rest[j + 1:].strip()
+    if rest.startswith('('):
+        ports = _ports(_split(rest[1:_balanced(rest, 0)]))
+    return {'name': name, 'parameters': params, 'ports': ports}
+
+def scan_file(fname: str) -> List[dict]:
+    """ returns the modules defined in ``fname``, as dictionaries with keys ``name``,
+    ``file``, ``line``, ``parameters`` and ``ports``."""
+    modules = []
+    with open(fname, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return modules
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            pos, line, counted = 0, 1, 0
+            while True:
+                m = _MODULE_RE.search(mm, pos)
+                if m is None:
+                    break
+                pos = m.end()
+                if m.group()[:1] in b'/"' or (m.start() and mm[m.start() - 1] in _WORD):
+                    continue
+                text, end = _header(mm, m.end())
+                info = _parse(text) if text is not None else None
+                if info is not None:
+                    line += mm[counted:m.start()].count(b'\n')
+                    counted = m.start()
+                    info['file'] = fname
+                    info['line'] = line
+                    modules.append(info)
+                # skip the body
+                pos = mm.find(b'endmodule', end)
+                if pos < 0:
+                    break
+                pos += len(b'endmodule')
+    return modules
+
+class _Entry(object):
+    """ indexed file: modification time and size, module names and (lazily decoded) modules."""
+    __slots__ = ('stamp', 'names', 'raw', '_modules')
+
+    def __init__(self, stamp: str, names: List[str], raw: str | None = None, modules: list | None = None):
+        self.stamp = stamp
+        self.names = names
+        self.raw = raw if raw is not None else json.dumps(modules, separators = (',', ':'))
+        self._modules = modules
+
+    @property
+    def modules(self) -> list:
+        if self._modules is None:
+            self._modules = json.loads(self.raw)
+        return self._modules
+
+class RTLIndex(Mapping):
+    """ index of the modules of one or more directory trees, mapping module names to
+    dictionaries with keys ``name``, ``file``, ``line``, ``parameters`` and ``ports``.
+
+    The index file has one line per scanned file (path, modification time, size, module
+    names and modules in JSON), so that loading and saving it does not decode the modules
+    of every file: they are only decoded when looked up.
+
+    Arguments:
+        roots      : directory (or list of directories) to scan.
+        index_file : file where the index is persisted (``None``: in memory only).
+        exts       : extensions of the scanned files.
+    """
+    def __init__(self, roots: str | Iterable[str], index_file: str | None = None,
+                 exts: Iterable[str] = ('.sv', '.v')):
+        self.roots = [roots] if isinstance(roots, str) else list(roots)
+        self.index_file = index_file
+        self.exts = tuple(exts)
+        self._files = {}
+        self._names = None
+        if index_file is not None and os.path.exists(index_file):
+            self._load()
+        self.refresh()
+
+    def _load(self):
+        try:
+            with open(self.index_file) as f:
+                if f.readline() != f'# svtmp rtl index {INDEX_VERSION}\n':
+                    return
+                files = {}
+                for line in f:
+                    path, stamp, names, raw = line.rstrip('\n').split('\t')
+                    files[path] = _Entry(stamp, names.split(), raw)
+            self._files = files
+        except (OSError, ValueError):
+            log.warning(f'SVTMP - ignoring unreadable index {self.index_file}')
+
+    def save(self):
+        """ writes the index to :attr:`index_file`."""
+        tmp = self.index_file + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(f'# svtmp rtl index {INDEX_VERSION}\n')
+            f.writelines([f"{p}\t{e.stamp}\t{' '.join(e.names)}\t{e.raw}\n" for p, e in self._files.items()])
+        os.replace(tmp, self.index_file)
+
+    def _walk(self, root: str):
+        for e in os.scandir(root):
+            if e.is_dir():
+                yield from self._walk(e.path)
+            elif e.name.endswith(self.exts):
+                yield e.path, e.stat()
+
+    def _update(self, path: str, st) -> bool:
+        """ rescans ``path`` if its stat ``st`` differs from the indexed one."""
+        stamp = f'{st.st_mtime_ns}:{st.st_size}'
+        entry = self._files.get(path)
+        if entry is not None and entry.stamp == stamp:
+            return False
+        modules = scan_file(path)
+        self._files[path] = _Entry(stamp, [m['name'] for m in modules], modules = modules)
+        return True
+
+    def refresh(self, paths: Iterable[str] | None = None) -> int:
+        """ rescans the files that were added or changed (by modification time or size) since
+        the last scan, forgets the deleted ones, and saves the index if anything changed.
+
+        Arguments:
+            paths : only check these files (e.g. the ones reported by an editor or by
+                    ``git status``) instead of walking the whole trees.
+
+        Returns: the number of (re)scanned or removed files.
+        """
+        changed = 0
+        if paths is None:
+            seen = set()
+            for root in self.roots:
+                for path, st in self._walk(root):
+                    seen.add(path)
+                    changed += self._update(path, st)
+            for path in [p for p in self._files if p not in seen]:
+                del self._files[path]
+                changed += 1
+        else:
+            for path in paths:
+                try:
+                    changed += self._update(path, os.stat(path))
+                except FileNotFoundError:
+                    changed += self._files.pop(path, None) is not None
+        if changed:
+            self._names = None
+            if self.index_file is not None:
+                self.save()
+        return changed
+
+    @property
+    def names(self) -> dict:
+        """ maps every module name to the file defining it."""
+        if self._names is None:
+            self._names = {}
+            for path in sorted(self._files):
+                for name in self._files[path].names:
+                    if name in self._names:
+                        log.warning(f'SVTMP - module {name} defined in {self._names[name]} '
+                                    f'and {path}, using the first one')
+                    else:
+                        self._names[name] = path
+        return self._names
+
+    def __getitem__(self, name: str) -> dict:
+        for m in self._files[self.names[name]].modules:
+            if m['name'] == name:
+                return m
+        raise KeyError(name)
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
@@ -0,0 +1,179 @@
+from __future__ import annotations
+
+"""
+Single-pass structural sanity checks for generated SystemVerilog.
+
+:meth:`check` tokenises the text once with a single regular expression (comments and
+strings are skipped) and verifies:
+
+* nesting of ``begin``/``end``, ``case``/``endcase``, ``module``/``endmodule``,
+  ``package``/``endpackage``, ``function``/``endfunction``, ``task``/``endtask``,
+  ``generate``/``endgenerate``, ``fork``/``join`` and ```ifdef``/```ifndef``/```endif``.
+* duplicate identifiers among the declarations of a scope (module, package, function,
+  task, ``begin``/``end`` block or struct) and among module ports.
+
+It is meant to catch template misuse before a long simulator elaboration, not to
+replace a parser: declarations are recognised on a line basis (``type name;``,
+``type [msb:lsb] name = ...;``) and only the first name of a multi-name declaration
+is checked.
+
+Example::
+
+    >> from svtmp.lint import check
+    >> check('module m;\\nlogic a;\\nlogic a;\\nendmodule\\n')
+       ["line 3: 'a' already declared at line 2"]
+
+"""
+
+import re
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import List
+
+_OPEN = {'begin': 'end', 'case': 'endcase', 'casez': 'endcase', 'casex': 'endcase',
+         'module': 'endmodule', 'package': 'endpackage', 'function': 'endfunction',
+         'task': 'endtask', 'generate': 'endgenerate', 'fork': 'join'}
+_CLOSE = {'end', 'endcase', 'endmodule', 'endpackage', 'endfunction', 'endtask',
+          'endgenerate', 'join', 'join_any', 'join_none'}
+# keywords that open a declaration scope
+_SCOPES = {'begin', 'module', 'package', 'function', 'task', 'fork'}
+
+_NOT_TYPES = ('assign|return|import|export|typedef|begin|end|else|if|case|casez|casex|for|foreach|'
+              'while|do|repeat|forever|default|always|always_ff|always_comb|always_latch|initial|'
+              'final|module|endmodule|package|endpackage|function|endfunction|task|endtask|'
+              'generate|endgenerate|input|output|inout|wait|disable|unique|unique0|priority|'
+              'struct|union|enum|extern|pure|virtual|fork|join|join_any|join_none')
+_WORD = r'[A-Za-z_]\w*(?:::[A-Za-z_]\w*)*'
+_DIMS = r'(?:\s*\[[^\]\n]*\])*'
+
+def _kw(words: str, tail: str = r'\b') -> str:
+    r""" keyword alternatives written as ``e(?<!\we)(?:ndcase|nd)\b``: starting every
+    alternative with a literal lets the regex engine skip quickly over the positions
+    that cannot start a token, which is what makes the single pass fast."""
+    by_initial = {}
+    for w in sorted(words.split('|'), key = len, reverse = True):
+        by_initial.setdefault(w[0], []).append(w[1:])
+    return '|'.join(f'{c}(?<!\\w{c})(?:{"|".join(rest)}){tail}' for c, rest in by_initial.items())
+
+_KEYWORDS = ('begin|end|case|casez|casex|endcase|module|endmodule|package|endpackage|function|'
+             'endfunction|task|endtask|generate|endgenerate|fork|join|join_any|join_none|'
+             'import|export|extern')
+
+_DECL = rf'\n[ \t]*(?=[A-Za-z_])(?!(?:{_NOT_TYPES})\b)(?:{_WORD}{_DIMS}[ \t]+)+(?P<decl>[A-Za-z_]\w*){_DIMS}[ \t]*[;=,]'
+_DECL_RE = re.compile(_DECL)
+_PORT = rf'\b\s+(?:{_WORD}{_DIMS}\s+|\[[^\]\n]*\]\s*)*(?P<{{}}>[A-Za-z_]\w*){_DIMS}\s*(?=[,;)=\n])'
+_STRUCT = r'\b[^{;\n]*\{'
+
+# no group may wrap a whole alternative (it would disable the literal-prefix scan):
+# tokens are classified from their text, only declaration/port names are captured
+_TOKEN_RE = re.compile(
+    r'//[^\n]*|/\*.*?\*/'
+    r'|"(?:\\.|[^"\\\n])*"'
+    rf'|{_DECL}'
+    '|' + '|'.join(_kw(d, _PORT.format(d)) for d in ('input', 'output', 'inout')) +
+    r'|`(?:ifdef|ifndef|elsif|else|endif)\b'
+    '|' + _kw('struct|union', _STRUCT) +
+    r'|\{|\}'
+    '|' + _kw(_KEYWORDS),
+    re.S)
+
+class SVCheckError(ValueError):
+    """ raised when generated SystemVerilog fails the structural checks.
+
+    Arguments:
+        issues : list of issue messages, as returned by :meth:`check`.
+    """
+    def __init__(self, issues: List[str]):
+        self.issues = issues
+        super().__init__('SVTMP - malformed SystemVerilog:\n  ' + '\n  '.join(issues))
+
+def check(txt: str) -> List[str]:
+    """ checks the structure of a SystemVerilog text in a single linear pass.
+
+    Arguments:
+        txt : SystemVerilog text.
+
+    Returns: a list of issue messages (``'line <n>: <issue>'``), empty if none was found.
+    """
+    issues = []
+    stack = []          # (keyword, line) of open constructs
+    scopes = [{}]       # declared name -> line, per declaration scope
+    directives = []     # lines of open `ifdef/`ifndef
+    braces = []         # brace depth of open structs
+    prototype = -1      # line of the last import/export/extern (DPI/extern prototypes)
+    line, pos = 1, 0
+
+    # declarations are matched from the preceding newline: the first line has none
+    first = _DECL_RE.match('\n' + txt[:txt.find('\n') + 1 or len(txt)])
+    if first is not None:
+        scopes[0][first.group('decl')] = 1
+
+    for m in _TOKEN_RE.finditer(txt):
+        kind = m.lastgroup
+        start = m.start() + (kind == 'decl')
+        line += txt.count('\n', pos, start)
+        pos = start
+        if kind is not None:
+            name = m.group(kind)
+            scope = scopes[-1]
+            if name in scope:
+                what = 'port ' if kind != 'decl' else ''
+                issues.append(f"line {line}: {what}'{name}' already declared at line {scope[name]}")
+            else:
+                scope[name] = line
+            continue
+
+        tok = m.group()
+        c = tok[0]
+        if c == '/' or c == '"':
+            continue
+        elif c == '`':
+            d = tok[1:]
+            if d in ('ifdef', 'ifndef'):
+                directives.append(line)
+            elif not directives:
+                issues.append(f'line {line}: `{d} without `ifdef/`ifndef')
+            elif d == 'endif':
+                directives.pop()
+        elif c == '{' or c == '}':
+            if braces:
+                braces[-1] += 1 if c == '{' else -1
+                if braces[-1] == 0:
+                    braces.pop()
+                    scopes.pop()
+        elif tok[-1] == '{': # struct/union
+            braces.append(1)
+            scopes.append({})
+        elif tok in ('import', 'export', 'extern'):
+            prototype = line
+        elif tok in _OPEN:
+            if (tok == 'function' or tok == 'task') and prototype == line:
+                continue
+            stack.append((tok, line))
+            if tok in _SCOPES:
+                scopes.append({})
+        elif not stack:
+            issues.append(f"line {line}: '{tok}' without opening keyword")
+        else:
+            okw, oline = stack[-1]
+            expected = _OPEN[okw]
+            if tok == expected or (expected == 'join' and tok.startswith('join')):
+                stack.pop()
+                if okw in _SCOPES:
+                    scopes.pop()
+            else:
+                issues.append(f"line {line}: '{tok}' closes '{okw}' opened at line {oline}")
+                # resynchronise on the closest matching opener, if any
+                for i in range(len(stack) - 1, -1, -1):
+                    if _OPEN[stack[i][0]] == tok:
+                        for okw, _ in stack[i:]:
+                            if okw in _SCOPES:
+                                scopes.pop()
+                        del stack[i:]
+                        break
+
+    for kw, oline in stack:
+        issues.append(f"line {oline}: '{kw}' is never closed")
+    for oline in directives:
+        issues.append(f'line {oline}: `ifdef/`ifndef is never closed')
+    return issues
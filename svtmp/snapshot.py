@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+"""
+Golden snapshots of generated output trees, for regression testing.
+
+A :class:`Snapshot` records the size and a SHA-256 digest of every generated file under a
+directory (optionally with its text, gzip compressed and stored by digest), and later verifies a
+new generation of the same tree against them. Files are hashed in parallel, files of a different
+size are reported without being hashed, and full diffs are only computed for the files that
+differ (and only if their text was recorded).
+
+The ``Created`` date and the copyright year of svtmp file headers are ignored, so that
+snapshots recorded on another day (or in another year) still match.
+
+Example::
+
+    $ python -m svtmp snapshot update rtl --text     # record (or re-record) rtl/
+    $ python -m svtmp snapshot verify rtl --diff     # exit code 1 on mismatches
+
+    >> from svtmp.snapshot import Snapshot
+    >> snap = Snapshot('test/golden')
+    >> result = snap.verify('rtl')
+    >> for name in result.changed:
+    >>     print(snap.diff('rtl', name))
+
+"""
+
+import gzip
+import hashlib
+import logging as log
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable, List
+
+SNAPSHOT_VERSION = 1
+# the creation date and copyright year of svtmp headers (both of a fixed length)
+HEADER_RE = re.compile(rb'(?<=^ \| Created  : )\d{4}-\d\d-\d\d$'
+                       rb'|(?<=^ \|  Copyright \(c\) Infineon Technologies AG )\d{4}(?= -)', re.M)
+
+class Result(object):
+    """ outcome of :meth:`Snapshot.verify`: sorted lists of the ``changed`` files, the
+    ``missing`` ones (recorded but not generated) and the ``new`` ones (generated but not recorded)."""
+    def __init__(self, changed: List[str], missing: List[str], new: List[str]):
+        self.changed = changed
+        self.missing = missing
+        self.new = new
+
+    def __bool__(self) -> bool:
+        """ ``True`` if the tree matches the snapshot."""
+        return not (self.changed or self.missing or self.new)
+
+    def __repr__(self) -> str:
+        return f'Result(changed={self.changed}, missing={self.missing}, new={self.new})'
+
+class Snapshot(object):
+    """ snapshot store: a directory with a manifest (one ``name size digest`` line per file,
+    the digest being computed without the ignored text)
+    and, for snapshots recorded with their text, the compressed texts by digest.
+
+    Arguments:
+        path   : directory of the snapshot.
+        exts   : extensions of the files recorded and verified.
+        ignore : compiled bytes regex of the text ignored when comparing files
+                 (default: the ``Created`` date and copyright year of svtmp headers;
+                 ``None``: nothing).
+    """
+    def __init__(self, path: str = '.svtmp_snapshot', exts: Iterable[str] = ('.sv', '.svh'),
+                 ignore = HEADER_RE):
+        self.path = path
+        self.exts = tuple(exts)
+        self.ignore = ignore
+        self.entries = {}   # file name (relative to the tree root) -> (size, digest)
+        manifest = os.path.join(path, 'manifest')
+        if os.path.exists(manifest):
+            self._load(manifest)
+
+    def _load(self, manifest: str):
+        with open(manifest) as f:
+            if f.readline() != f'# svtmp snapshot {SNAPSHOT_VERSION}\n':
+                log.warning(f'SVTMP - ignoring snapshot {self.path} of an unknown version')
+                return
+            for line in f:
+                name, size, digest = line.rstrip('\n').split('\t')
+                self.entries[name] = (int(size), digest)
+
+    def _files(self, root: str) -> List[str]:
+        files = []
+        for d, _, fnames in os.walk(root):
+            rel = os.path.relpath(d, root)
+            for fname in fnames:
+                if fname.endswith(self.exts):
+                    files.append(fname if rel == '.' else f"{rel.replace(os.sep, '/')}/{fname}")
+        return sorted(files)
+
+    def _read(self, root: str, name: str) -> bytes:
+        """ contents of file ``name``, without the ignored text."""
+        with open(os.path.join(root, *name.split('/')), 'rb') as f:
+            data = f.read()
+        return self.ignore.sub(b'', data) if self.ignore is not None else data
+
+    def _sized(self) -> bool:
+        """ True if files of different sizes cannot match (the ignored text has a fixed length)."""
+        return self.ignore is None or self.ignore is HEADER_RE
+
+    def _object(self, digest: str) -> str:
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.gz')
+
+    def _record_file(self, root: str, name: str, text: bool):
+        size = os.stat(os.path.join(root, *name.split('/'))).st_size
+        data = self._read(root, name)
+        digest = hashlib.sha256(data).hexdigest()
+        if text:
+            fname = self._object(digest)
+            if not os.path.exists(fname):
+                os.makedirs(os.path.dirname(fname), exist_ok = True)
+                tmp = f'{fname}.{os.getpid()}.tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(_gzip(data))
+                os.replace(tmp, fname)
+        return size, digest
+
+    def record(self, root: str, text: bool = False, workers: int | None = None) -> int:
+        """ (re)records the files under ``root``, replacing the previous snapshot.
+
+        Arguments:
+            root    : root directory of the generated tree.
+            text    : also store the (compressed) texts, so that :meth:`diff` can show changes.
+            workers : number of threads hashing the files (default: see ``ThreadPoolExecutor``).
+
+        Returns: the number of recorded files.
+        """
+        files = self._files(root)
+        with ThreadPoolExecutor(workers) as ex:
+            stats = list(ex.map(lambda name: self._record_file(root, name, text), files))
+        self.entries = dict(zip(files, stats))
+        os.makedirs(self.path, exist_ok = True)
+        manifest = os.path.join(self.path, 'manifest')
+        with open(manifest + '.tmp', 'w') as f:
+            f.write(f'# svtmp snapshot {SNAPSHOT_VERSION}\n')
+            f.writelines([f'{n}\t{s}\t{d}\n' for n, (s, d) in self.entries.items()])
+        os.replace(manifest + '.tmp', manifest)
+        self._prune(set([d for _, d in self.entries.values()]) if text else set())
+        log.info(f'SVTMP - {len(files)} files recorded in snapshot {self.path}')
+        return len(files)
+
+    def _prune(self, keep: set):
+        """ removes the stored texts that are not referenced by the manifest."""
+        objects = os.path.join(self.path, 'objects')
+        if not os.path.isdir(objects):
+            return
+        for d, _, fnames in os.walk(objects):
+            for fname in fnames:
+                if fname[:-len('.gz')] not in keep:
+                    os.remove(os.path.join(d, fname))
+
+    def _matches(self, root: str, name: str) -> bool:
+        size, digest = self.entries[name]
+        # files of a different size are reported without being hashed
+        if self._sized() and os.stat(os.path.join(root, *name.split('/'))).st_size != size:
+            return False
+        return hashlib.sha256(self._read(root, name)).hexdigest() == digest
+
+    def verify(self, root: str, workers: int | None = None) -> Result:
+        """ compares the files under ``root`` with the snapshot.
+
+        Arguments:
+            root    : root directory of the generated tree.
+            workers : number of threads hashing the files.
+
+        Returns: a :class:`Result` (true if everything matches).
+        """
+        files = self._files(root)
+        common = [f for f in files if f in self.entries]
+        with ThreadPoolExecutor(workers) as ex:
+            matches = list(ex.map(lambda name: self._matches(root, name), common))
+        present = set(files)
+        result = Result([f for f, ok in zip(common, matches) if not ok],
+                        sorted([f for f in self.entries if f not in present]),
+                        [f for f in files if f not in self.entries])
+        if result:
+            log.info(f'SVTMP - {len(common)} files match snapshot {self.path}')
+        else:
+            log.info(f'SVTMP - snapshot {self.path}: {len(result.changed)} changed, '
+                     f'{len(result.missing)} missing, {len(result.new)} new files')
+        return result
+
+    def diff(self, root: str, name: str) -> str | None:
+        """ unified diff between the recorded text of file ``name`` and the one under ``root``
+        (``None`` if its text was not recorded)."""
+        import difflib
+        try:
+            with gzip.open(self._object(self.entries[name][1])) as f:
+                old = f.read().decode()
+        except (KeyError, OSError):
+            return None
+        new = self._read(root, name).decode()
+        return ''.join(difflib.unified_diff(old.splitlines(True), new.splitlines(True),
+                                            f'snapshot/{name}', f'{root}/{name}'))
+
+def _gzip(data: bytes) -> bytes:
+    """ gzip compression with a fixed timestamp, so that identical texts give identical objects
+    (``gzip.compress`` has no ``mtime`` argument in python 3.7)."""
+    import io
+    buf = io.BytesIO()
+    with gzip.GzipFile(filename = '', mode = 'wb', fileobj = buf, mtime = 0) as f:
+        f.write(data)
+    return buf.getvalue()
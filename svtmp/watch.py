@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+"""
+Regeneration of only the outputs affected by changed inputs.
+
+A :class:`Watcher` runs generator scripts in-process (with :mod:`runpy`) and records, for
+every file written by :meth:`svtmp.SVTxt.to_sv_file`/:meth:`svtmp.SVTxt.to_svh_file`, the
+inputs it was produced from:
+
+* the Python modules reachable from the script (the script itself, the modules it imported
+  and the modules of the functions and objects it uses), outside the Python installation.
+* the data files the script opened for reading before writing the output (python 3.8+,
+  through an audit hook).
+
+:meth:`watch` then polls the modification time of those inputs, and only re-runs the scripts
+whose inputs changed. The interpreter and every unaffected module stay loaded between runs,
+so expensive imports and module level caches are not rebuilt.
+
+Example::
+
+    $ python -m svtmp watch gen_regs.py gen_top.py
+
+    >> from svtmp.watch import watch
+    >> watch(['gen_regs.py', 'gen_top.py'])
+
+"""
+
+import logging as log
+import os
+import runpy
+import sys
+import time
+from types import ModuleType
+import svtmp
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from typing import Iterable, List, Set
+
+# modules under these directories (python installation, svtmp itself) are not tracked
+_SKIP = tuple({os.path.join(os.path.realpath(p), '') for p in
+               (sys.prefix, sys.base_prefix, sys.exec_prefix, os.path.dirname(svtmp.__file__))})
+
+_recorder = None    # Watcher collecting the inputs of the script being run
+
+def _audit(event: str, args: tuple):
+    if _recorder is None or event != 'open':
+        return
+    path, mode, flags = args
+    if not isinstance(path, (str, bytes)):
+        return
+    if mode is None:
+        reading = flags & (os.O_WRONLY | os.O_RDWR) == 0
+    else:
+        reading = 'r' in mode
+    if reading:
+        path = os.path.realpath(os.fsdecode(path))
+        # the python installation and compiled modules are not inputs
+        if not path.startswith(_SKIP) and not path.endswith('.pyc'):
+            _recorder._reads.add(path)
+
+_audit_installed = False
+
+def _install_audit():
+    global _audit_installed
+    if not _audit_installed and hasattr(sys, 'addaudithook'):   # python 3.8+
+        sys.addaudithook(_audit)
+        _audit_installed = True
+
+def _user_file(m) -> str | None:
+    """ returns the (real) source file of module ``m``, if it is tracked."""
+    f = getattr(m, '__file__', None)
+    if not isinstance(f, str):
+        return None
+    f = os.path.realpath(f)
+    return None if f.startswith(_SKIP) else f
+
+def _module_files(ns: dict) -> Set[str]:
+    """ source files of the tracked modules reachable from the globals ``ns``."""
+    files, seen, todo = set(), set(), [ns]
+    while todo:
+        for v in list(todo.pop().values()):
+            name = v.__name__ if isinstance(v, ModuleType) else getattr(v, '__module__', None)
+            if not isinstance(name, str) or name in seen:
+                continue
+            seen.add(name)
+            m = sys.modules.get(name)
+            f = _user_file(m)
+            if f is not None:
+                files.add(f)
+                todo.append(vars(m))
+    return files
+
+class Watcher(object):
+    """ runs generator scripts and re-runs those whose inputs changed.
+
+    Arguments:
+        scripts : paths of the generator scripts (run as ``__main__``, in the current directory).
+
+    Attributes:
+        inputs  : per script, the set of files it depends on.
+        outputs : per script, a dictionary from each written file to the inputs it was produced from.
+    """
+    def __init__(self, scripts: Iterable[str]):
+        self.scripts = [os.path.realpath(s) for s in scripts]
+        self.inputs = {}
+        self.outputs = {}
+        self._mtimes = {}
+        self._reads = set()
+        _install_audit()
+
+    def _written(self, fname: str):
+        self._outs[os.path.realpath(fname)] = set(self._reads)
+
+    def run(self, script: str) -> bool:
+        """ runs ``script`` and records its inputs and outputs.
+
+        Returns: ``True`` if the script ran without errors.
+        """
+        global _recorder
+        self._reads, self._outs = set(), {}
+        before = set(sys.modules)
+        argv, path0 = sys.argv, os.path.dirname(script)
+        sys.argv = [script]
+        sys.path.insert(0, path0)
+        svtmp._output_hooks.append(self._written)
+        _recorder, ok, ns = self, True, {}
+        try:
+            ns = runpy.run_path(script, run_name = '__main__')
+        except (Exception, SystemExit):
+            log.exception(f'SVTMP - {script} failed')
+            ok = False
+        finally:
+            _recorder = None
+            svtmp._output_hooks.remove(self._written)
+            sys.argv = argv
+            sys.path.remove(path0)
+
+        modules = _module_files(ns) | {script}
+        for name in set(sys.modules) - before:
+            f = _user_file(sys.modules[name])
+            if f is not None:
+                modules.add(f)
+        outs = set(self._outs)
+        reads = {f for f in self._reads if f not in outs and os.path.isfile(f)}
+        # a failed run keeps its previous inputs, so fixing any of them triggers a new run
+        deps = modules | reads | (set() if ok else self.inputs.get(script, set()))
+        self.inputs[script] = deps
+        self.outputs[script] = {o: modules | {f for f in r if f in reads} for o, r in self._outs.items()}
+        for f in deps:
+            self._mtimes[f] = self._mtime(f)
+        return ok
+
+    @staticmethod
+    def _mtime(f: str):
+        try:
+            return os.stat(f).st_mtime_ns
+        except OSError:
+            return None
+
+    def changed(self) -> Set[str]:
+        """ returns the inputs modified since they were last seen."""
+        changed = set()
+        for f, t in self._mtimes.items():
+            t2 = self._mtime(f)
+            if t2 != t:
+                self._mtimes[f] = t2
+                changed.add(f)
+        return changed
+
+    def step(self) -> List[str]:
+        """ re-runs the scripts affected by input changes since the previous call.
+        Tracked modules those scripts depend on are reloaded on the next import.
+
+        Returns: the list of scripts that were re-run.
+        """
+        changed = self.changed()
+        if not changed:
+            return []
+        affected = [s for s in self.scripts if self.inputs.get(s, {s}) & changed]
+        stale = set().union(*[self.inputs[s] for s in affected if s in self.inputs])
+        for name, m in list(sys.modules.items()):
+            if _user_file(m) in stale:
+                del sys.modules[name]
+        for s in affected:
+            self.run(s)
+            log.info(f'SVTMP - regenerated {", ".join(sorted(self.outputs[s])) or "nothing"} ({s})')
+        return affected
+
+    def loop(self, interval: float = 0.2):
+        """ runs all scripts, then re-runs the affected ones every ``interval`` seconds until interrupted."""
+        for s in self.scripts:
+            self.run(s)
+        log.info(f'SVTMP - watching {len(self._mtimes)} files')
+        try:
+            while True:
+                time.sleep(interval)
+                self.step()
+        except KeyboardInterrupt:
+            pass
+
+def watch(scripts: Iterable[str], interval: float = 0.2):
+    """ runs the generator ``scripts``, and regenerates the outputs affected by every later
+    change of their inputs (see :class:`Watcher`), until interrupted with Ctrl-C.
+
+    Arguments:
+        scripts  : paths of the generator scripts.
+        interval : polling period, in seconds.
+    """
+    Watcher(scripts).loop(interval)
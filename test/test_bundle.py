@@ -0,0 +1,56 @@
+import os
+import tarfile
+import zipfile
+import pytest
+from svtmp import *
+from svtmp.bundle import Bundle, extract
+
+def generate(n, path):
+    for i in reversed(range(n)):
+        t = SVTxt()
+        t.add(assign('q_o', f"8'd{i}"))
+        t.to_module(f'm{i}', [outvec('q_o', 7, 0)])
+        t.to_sv_file(f'm{i}', path, prj = 'bundle')
+
+@pytest.mark.parametrize('ext', ['.tar', '.tar.gz', '.tar.xz', '.zip'])
+def test_bundle(tmp_path, monkeypatch, ext):
+    monkeypatch.chdir(tmp_path)
+    with Bundle('a' + ext) as b:
+        generate(5, 'rtl')
+        b.add('doc/readme.txt', 'generated\n')
+    assert not os.path.exists('rtl')
+    assert b.names == ['doc/readme.txt'] + [f'rtl/m{i}.sv' for i in range(5)]
+    # reproducible
+    with Bundle('b' + ext) as b:
+        b.add('doc/readme.txt', 'generated\n')
+        generate(5, 'rtl')
+    assert open('a' + ext, 'rb').read() == open('b' + ext, 'rb').read()
+
+    written = extract('a' + ext, 'out')
+    assert len(written) == 6
+    generate(5, '.')
+    assert open('out/rtl/m3.sv').read() == open('m3.sv').read()
+    # unchanged files are not rewritten
+    os.remove('out/rtl/m1.sv')
+    with open('out/rtl/m2.sv', 'a') as f:
+        f.write('// edited\n')
+    assert sorted(extract('a' + ext, 'out')) == [os.path.join('out', 'rtl', 'm1.sv'), os.path.join('out', 'rtl', 'm2.sv')]
+    assert extract('a' + ext, 'out') == []
+
+def test_bundle_errors(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        Bundle('a.rar')
+    with pytest.raises(ValueError):
+        with Bundle('a.tar') as b:
+            b.add('../x.sv', '')
+    assert not os.path.exists('a.tar')
+    with pytest.raises(ValueError):
+        with Bundle('a.tar') as b:
+            b.add('x.sv', '')
+            b.add('./x.sv', '')
+    with tarfile.open('evil.tar', 'w') as tar:
+        info = tarfile.TarInfo('../evil.sv')
+        tar.addfile(info)
+    with pytest.raises(ValueError):
+        extract('evil.tar', 'out')
@@ -0,0 +1,86 @@
+import os
+import pytest
+from svtmp import *
+import functools
+from svtmp.cache import DiskCache, memoize, key
+
+calls = []
+
+def table(n, kind = 'case'):
+    calls.append(n)
+    return case('s', [(i, eq('q', f'd{i}')) for i in range(n)], kind = kind, width = 8)
+
+def test_memoize(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    cached = memoize(table, cache = cache)
+    ref = table(40)
+    calls.clear()
+    assert cached(40) == ref and calls == [40]
+    assert cached(40) == ref and calls == [40]
+    assert cached(40, kind = 'unique case') != ref and calls == [40, 40]
+    # a new instance on the same directory (i.e. a new run) reuses the entries
+    assert memoize(table, cache = DiskCache(str(tmp_path)))(40) == ref and calls == [40, 40]
+
+    assert memoize(lambda d: sorted(d.items()), cache = cache)({'a': [1, 2.5], 'b': None}) == [('a', [1, 2.5]), ('b', None)]
+    with pytest.raises(TypeError):
+        cached(object())
+
+def test_key():
+    assert key(table, (1,), {'kind': 'case'}) == key(table, (1,), {'kind': 'case'})
+    assert key(table, ({'a': 1, 'b': 2},), {}) == key(table, ({'b': 2, 'a': 1},), {})
+    assert key(table, ((1, 2),), {}) != key(table, ([1, 2],), {})
+    assert key(table, ('1',), {}) != key(table, (1,), {})
+    assert key(table, (1,), {}) != key(lambda n: n, (1,), {})
+
+def make_ff(clk):
+    def ff(q, d):
+        return always_ff(eq(q, "'0"), eq(q, d), clk = clk)
+    return ff
+
+def test_key_closure(tmp_path):
+    # closures are keyed by the values they capture
+    cache = DiskCache(str(tmp_path))
+    a, b = make_ff('clk_a'), make_ff('clk_b')
+    assert key(a, ('q', 'd'), {}) != key(b, ('q', 'd'), {})
+    assert key(a, ('q', 'd'), {}) == key(make_ff('clk_a'), ('q', 'd'), {})
+    assert memoize(a, cache = cache)('q', 'd') == a('q', 'd')
+    assert memoize(b, cache = cache)('q', 'd') == b('q', 'd') != a('q', 'd')
+    obj = object()
+    with pytest.raises(TypeError):
+        key(lambda: obj, (), {})
+
+def test_key_partial(tmp_path):
+    casez = functools.partial(case, kind = 'casez')
+    args = ('s', [(0, eq('q', '0'))])
+    assert key(casez, args, {}) == key(functools.partial(case, kind = 'casez'), args, {})
+    assert key(casez, args, {}) != key(functools.partial(case, kind = 'case'), args, {})
+    assert memoize(casez, cache = DiskCache(str(tmp_path)))(*args) == case(*args, kind = 'casez')
+
+def test_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size = 10000)
+    for i in range(30):
+        cache.put(f'k{i}', 'x' * 1000)
+        st = os.stat(tmp_path / f'k{i}')
+        os.utime(tmp_path / f'k{i}', ns = (st.st_atime_ns, i * 10**9))
+    assert cache.size() <= 10000
+    assert cache.get('k29') == 'x' * 1000 and cache.get('k0') is None
+    cache.clear()
+    assert cache.size() == 0
+    # overwriting an entry does not count its size twice
+    for i in range(30):
+        cache.put('k', 'x' * 1000)
+    cache.put('l', 'y')
+    assert cache._size == cache.size() and cache.get('k') == 'x' * 1000
+
+def test_key_location(tmp_path):
+    # the same function in two checkouts (different file names and line numbers) has the same key
+    src = 'def gen(n):\n    return [f"q[{i}]" for i in range(n)]\n'
+    funcs = []
+    for path, pad in (('a/gen.py', ''), ('b/gen.py', '\n\n\n')):
+        ns = {'__name__': 'gen'}
+        exec(compile(pad + src, str(tmp_path / path), 'exec'), ns)
+        funcs.append(ns['gen'])
+    assert key(funcs[0], (3,), {}) == key(funcs[1], (3,), {})
+    ns = {'__name__': 'gen'}
+    exec(compile(src.replace('q[', 'd['), 'gen.py', 'exec'), ns)
+    assert key(ns['gen'], (3,), {}) != key(funcs[0], (3,), {})
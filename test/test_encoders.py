@@ -0,0 +1,39 @@
+import pytest
+from svtmp import *
+from svtmp.encoders import *
+
+def test_bin2th():
+    IW, OW = 4, 16
+    items = [citem(ui2h(i, IW), eq('th_o', ui2b((2**(i+1))-1, OW))) for i in range(OW)]
+    aff = make_always_ff()
+    assert bin2th('sel_i', 'th_o', IW, aff = aff) == always_ff(eq('th_o', "'0"), case('sel_i', items))
+
+    s = bin2th('sel_i', 'th_o', 2, ow = 3)
+    assert "2'h2:    th_o = 3'b111;" in s
+    assert "default:    th_o = '1;" in s
+
+    with pytest.raises(ValueError):
+        bin2th('sel_i', 'th_o', 2, ow = 5)
+
+    assert bin2th('sel_i', 'th_o', 12, loop = True) == always_comb([
+        "th_o = '0;",
+        For('i', 0, 4096, eq('th_o[i]', 'i <= sel_i', block = True))])
+
+def test_decoders():
+    assert "2'h2:    oh = 4'b0100;" in bin2oh('b', 'oh', 2)
+    assert "4'b0100:    b = 2'h2;" in oh2bin('oh', 'b', 4)
+    s = prio_enc('r', 'g', 4)
+    assert "4'b??10:    g = 2'h1;" in s and s.startswith('always_comb\nbegin\n   g = \'0;\n   casez(r)')
+    assert "4'b01??:    g = 2'h2;" in prio_enc('r', 'g', 4, msb = True)
+    assert 'for (int i = 3; i > -1; i--)' in prio_enc('r', 'g', 4, loop = True)
+    assert 'for (int i = 0; i < 4; i++)' in prio_enc('r', 'g', 4, msb = True, loop = True)
+    # registered loop forms clear the output when no bit is set
+    aff = make_always_ff()
+    loop = For('i', 0, 4, If('r[i]', eq('g', 'i')))
+    assert prio_enc('r', 'g', 4, msb = True, loop = True, aff = aff) == always_ff(eq('g', "'0"), [eq('g', "'0"), loop])
+    assert oh2bin('r', 'g', 4, loop = True, aff = aff) == always_ff(eq('g', "'0"), [eq('g', "'0"), loop])
+
+def test_gray():
+    assert bin2gray('b', 'g', 3) == always_comb(["g = '0;", 'g[2] = b[2];', 'g[1] = b[2] ^ b[1];', 'g[0] = b[1] ^ b[0];'])
+    assert gray2bin('g', 'b', 3) == always_comb(["b = '0;", 'b[2] = ^g[2:2];', 'b[1] = ^g[2:1];', 'b[0] = ^g[2:0];'])
+    assert 'b[i] <= ^(g >> i);' in gray2bin('g', 'b', 3, loop = True, aff = make_always_ff())
@@ -0,0 +1,53 @@
+import os
+from svtmp import *
+from svtmp.index import RTLIndex, scan_file
+
+FIFO = '''// module fake (input a);
+module sync_fifo import fifo_pkg::*; #(parameter int DEPTH = 16, W = 8)
+  ( input  logic clk_i, // clock
+    input  logic [W-1:0] data_i,
+    input        rst_ni,
+    output logic full_o, empty_o,
+    output data_t [3:0] q_o [2],
+    axi_if.master bus
+  );
+  string s = "module nope (input x);";
+  submodule u_x (.a(b));
+endmodule : sync_fifo
+
+module old_style (a, b);
+  input a; output b;
+endmodule
+'''
+
+def test_scan_file(tmp_path):
+    f = tmp_path / 'fifo.sv'
+    f.write_text(FIFO)
+    fifo, old = scan_file(str(f))
+    assert fifo['name'] == 'sync_fifo' and fifo['line'] == 2
+    assert fifo['parameters'] == ['parameter int DEPTH = 16', 'parameter W = 8']
+    assert fifo['ports'] == [Input('clk_i'), invec('data_i', 'W-1', 0), Input('rst_ni'), Output('full_o'),
+                             Output('empty_o'), 'output data_t [3:0] q_o [2]', 'axi_if.master bus']
+    assert old['name'] == 'old_style' and old['ports'] == ['a', 'b']
+
+def test_index(tmp_path):
+    rtl = tmp_path / 'rtl'
+    (rtl / 'sub').mkdir(parents = True)
+    (rtl / 'fifo.sv').write_text(FIFO)
+    (rtl / 'sub' / 'ff.sv').write_text(module('ff', assign('q_o', 'd_i'), ios = [Input('d_i'), outvec('q_o', 3, 0)]))
+    index_file = str(tmp_path / 'rtl.idx')
+    idx = RTLIndex(str(rtl), index_file)
+    assert sorted(idx) == ['ff', 'old_style', 'sync_fifo']
+    assert idx['ff']['ports'] == [Input('d_i'), outvec('q_o', 3, 0)]
+
+    idx = RTLIndex(str(rtl), index_file)
+    assert idx.refresh() == 0 and idx['ff']['ports'] == [Input('d_i'), outvec('q_o', 3, 0)]
+    ff = str(rtl / 'sub' / 'ff.sv')
+    with open(ff, 'w') as f:
+        f.write(module('ff2', 'x', ios = [Input('d_i')]))
+    st = os.stat(ff)
+    os.utime(ff, ns = (st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert idx.refresh() == 1 and 'ff' not in idx and idx['ff2']['ports'] == [Input('d_i')]
+    os.remove(ff)
+    assert idx.refresh([ff]) == 1 and sorted(idx) == ['old_style', 'sync_fifo']
+    assert sorted(RTLIndex(str(rtl), index_file)) == ['old_style', 'sync_fifo']
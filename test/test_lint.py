@@ -0,0 +1,28 @@
+import pytest
+from svtmp import *
+from svtmp.lint import check, SVCheckError
+
+def test_nesting():
+    assert check(module('m', always_comb(['a = 1;', 'b = 2;']), ios = inputs(['a', 'b']))) == []
+    assert check('begin\ncase(x)\nend\n') == ["line 3: 'end' closes 'case' opened at line 2"]
+    assert check('module m;\nbegin\n') == ["line 1: 'module' is never closed", "line 2: 'begin' is never closed"]
+    assert check('endpackage\n') == ["line 1: 'endpackage' without opening keyword"]
+    assert check(ifdef('A') + '\n' + ifndef('B') + '\n' + endif()) == ['line 1: `ifdef/`ifndef is never closed']
+    # keywords in comments, strings and identifiers are ignored
+    assert check('// begin\n/* case\n module */ $display("end");\nlogic end_o;\n') == []
+
+def test_duplicates():
+    assert check('module m;\nlogic a;\nlogic [3:0] a;\nendmodule\n') == ["line 3: 'a' already declared at line 2"]
+    assert check(module('m', logic('a'), ios = [Input('a'), outvec('b', 3, 0)])) == ["line 6: 'a' already declared at line 2"]
+    assert check(module('m', '', ios = [Input('a'), outvec('a', 3, 0)])) == ["line 3: port 'a' already declared at line 2"]
+    # struct fields and begin-end blocks are separate scopes
+    assert check(struct('s_t', [logic('a'), logic('b')]) + '\n' + logic('a')) == []
+
+def test_svtxt_check(tmp_path):
+    t = SVTxt()
+    t.add([logic('a'), logic('a')])
+    t.to_module('m', ios = [Input('clk_i')])
+    assert t.check() == ["line 6: 'a' already declared at line 5"]
+    with pytest.raises(SVCheckError):
+        t.to_sv_file('m', path = str(tmp_path), check = True)
+    assert list(tmp_path.iterdir()) == []
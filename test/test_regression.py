@@ -139,3 +139,525 @@ def test_struct():
     with pytest.raises(ValueError):
         struct(typ = 'dum', decls = '')
     
+
+def test_fragment_pool():
+    pool = FragmentPool()
+    t1 = SVTxt(pool = pool)
+    t2 = SVTxt(pool = pool)
+    t1.add(always_ff(eq('q', ui2b(0,1)), eq('q', 'd')))
+    t2.add([logic('q'), always_ff(eq('q', ui2b(0,1)), eq('q', 'd'))])
+    assert t1._chunks[0] is t2._chunks[2]
+    assert t1.txt == always_ff(eq('q', ui2b(0,1)), eq('q', 'd')) + '\n'
+    assert t2.txt == logic('q') + '\n' + t1.txt
+    assert len(pool) == 2
+
+    del t1, t2
+    assert len(pool) == 0
+
+    t = SVTxt()
+    t.add([])
+    t.addsp(['a', 'b'])
+    t.sep()
+    assert t.txt == '\na\nb\n\n\n'
+
+def test_template_registry():
+    class EntryPoint:
+        loads = 0
+        def __init__(self, name):
+            self.name = name
+        def load(self):
+            EntryPoint.loads += 1
+            return lambda sig: logic(sig)
+
+    reg = TemplateRegistry(group = 'svtmp.test')
+    reg._eps = {'axi_slave': EntryPoint('axi_slave')}
+    reg.register('dff', always_ff)
+
+    assert EntryPoint.loads == 0
+    assert reg['dff'] is always_ff
+    assert reg['axi_slave']('a') == 'logic a;'
+    assert reg['axi_slave']('b') == 'logic b;'
+    assert EntryPoint.loads == 1
+    assert sorted(reg) == ['axi_slave', 'dff']
+    assert 'axi_slave' in reg and 'apb' not in reg
+
+    with pytest.raises(KeyError):
+        reg['apb']
+
+def test_coalesce_ff():
+    t = SVTxt(coalesce_ff = True)
+    t.add(logic('a'))
+    t.add_ff(eq('a', ui2b(0,1)), eq('a', 'a_d'))
+    t.add_ff([eq('c', ui2b(0,1))], [eq('c', 'c_d')], clk = 'clk2_i')
+    t.add(logic('b'))
+    aff = t.make_always_ff()
+    aff(eq('b', ui2b(0,1)), eq('b', 'b_d'))
+    t.add(assign('x', 'b'))
+
+    # each block follows the last fragment that updated its domain (and the declarations before it)
+    ref  = logic('a') + '\n'
+    ref += always_ff(eq('c', ui2b(0,1)), eq('c', 'c_d'), clk = 'clk2_i') + '\n'
+    ref += logic('b') + '\n'
+    ref += always_ff([eq('a', ui2b(0,1)), eq('b', ui2b(0,1))], [eq('a', 'a_d'), eq('b', 'b_d')]) + '\n'
+    ref += assign('x', 'b') + '\n'
+    assert t.txt == ref
+
+    t = SVTxt()
+    t.add_ff(eq('a', ui2b(0,1)), eq('a', 'a_d'))
+    t.add_ff(eq('b', ui2b(0,1)), eq('b', 'b_d'))
+    assert t.txt.count('always_ff') == 2
+
+def test_reroll():
+    stmts = [eq(f'data[{i}]', f'in[{i+1}]') for i in range(8)]
+    assert reroll(stmts) == [For('i', 0, 8, eq('data[i]', 'in[i + 1]'))]
+    assert block(stmts, roll = True) == block([For('i', 0, 8, eq('data[i]', 'in[i + 1]'))])
+    assert reroll(stmts[:3]) == stmts[:3]
+
+    # not affine / variable range select in procedural code: unrolled
+    assert reroll([eq('q', ui2b(2**i, 8)) for i in range(8)]) == [eq('q', ui2b(2**i, 8)) for i in range(8)]
+    slices = [eq(f'a[{8*i+7}:{8*i}]', f'b[{i}]') for i in range(4)]
+    assert reroll(slices) == slices
+    assert reroll([eq(f'a[{8*i}+:8]', f'b[{i}]') for i in range(4)]) == [For('i', 0, 4, eq('a[8*i+:8]', 'b[i]'))]
+
+    # runs are rerolled independently, sized literals become casts
+    stmts = [logic('x')] + [eq('v', ui2h(2*i, 8)) for i in range(5)] + [eq('w', '1')]
+    assert reroll(stmts) == [logic('x'), For('i', 0, 5, eq('v', "8'(2*i)")), eq('w', '1')]
+    # values with the msb set stay unsigned (zero-extended into a wider target)
+    assert reroll([eq('w', ui2h(i, 8)) for i in range(200)]) == [For('i', 0, 200, eq('w', "8'(unsigned'(i))"))]
+    assert reroll([eq('w', ui2h(i, 8)) for i in range(128)]) == [For('i', 0, 128, eq('w', "8'(i)"))]
+    # constant sized literals are kept as is, next to varying ones
+    assert reroll([eq(f'q[{i}]', ui2b(0, 1)) for i in range(5)]) == [For('i', 0, 5, eq('q[i]', "1'b0"))]
+    stmts = [eq(f'q[{i}]', f"{ui2h(3, 8)} + {ui2h(i, 4)}") for i in range(5)]
+    assert reroll(stmts) == [For('i', 0, 5, eq('q[i]', "8'h03 + 4'(i)"))]
+    assert block(stmts, roll = True) == block([For('i', 0, 5, eq('q[i]', "8'h03 + 4'(i)"))])
+    # replication counts must be constant
+    stmts = [eq(f'q[{i}]', f"{{{i + 1}{{1'b1}}}}") for i in range(5)]
+    assert reroll(stmts) == stmts
+    assert reroll([eq(f'q[{i}]', "{2{1'b1}}") for i in range(5)]) == [For('i', 0, 5, eq('q[i]', "{2{1'b1}}"))]
+
+    t = SVTxt(roll = True)
+    t.add([assign(f'a[{8*i+7}:{8*i}]', f'b[{i}]') for i in range(4)])
+    assert t.txt == ('generate\n'
+                     '   for (genvar i = 0; i < 4; i++)\n'
+                     '   begin\n'
+                     '      assign a[8*i + 7:8*i] = b[i];\n'
+                     '   end\n'
+                     'endgenerate\n')
+
+    items = [citem(ui2h(i, 4), eq('q', f'in[{15-i}]')) for i in range(16)]
+    assert case('sel_i', items, roll = True) == For('i', 0, 16, If("sel_i == 4'(unsigned'(i))", eq('q', 'in[15 - i]'))) + '\n'
+    items = [citem(ui2h(i, 4), eq('q', ui2b(2**i, 16))) for i in range(16)]
+    assert case('sel_i', items, roll = True) == case('sel_i', items)
+
+def test_provenance(tmp_path):
+    t = SVTxt(provenance = True, coalesce_ff = True)
+    t.add([logic('a'), logic('b')]); l_add = test_provenance.__code__.co_firstlineno + 2
+    t.sep()
+    t.add_ff(eq('a', ui2b(0,1)), eq('a', 'b')); l_ff = l_add + 2
+    t.addsp(comment('end'))
+    assert t.source_map() == [(1, 2, __file__, l_add), (4, 10, __file__, l_ff), (11, 11, __file__, l_ff + 1)]
+
+    t.to_module('m', ios = inputs(['clk_i', 'reset_n_i']))
+    t.to_sv_file('m', path = str(tmp_path))
+    lines = (tmp_path / 'm.sv').read_text().split('\n')
+    smap = (tmp_path / 'm.sv.map').read_text().split('\n')
+    assert smap[0] == '# svtmp source map: m.sv'
+    first, last = [int(n) for n in smap[2].split()[0].split('-')]
+    assert smap[2].endswith(f'{__file__}:{l_ff}')
+    assert lines[first - 1].strip().startswith('always_ff') and lines[last - 1].strip() == 'end'
+    assert lines[int(smap[3].split('-')[0]) - 1].strip() == '// end'
+
+def test_sv_file_name(tmp_path):
+    # to_sv_file writes <name>.sv (it used to write <name>.svh, clobbering to_svh_file)
+    t = SVTxt()
+    t.add(logic('a'))
+    t.to_sv_file('m', path = str(tmp_path))
+    t.to_svh_file('m', path = str(tmp_path))
+    assert sorted(f.name for f in tmp_path.iterdir()) == ['m.sv', 'm.svh']
+    assert ' | File     : m.sv\n' in (tmp_path / 'm.sv').read_text()
+    assert ' | File     : m.svh\n' in (tmp_path / 'm.svh').read_text()
+
+def _eval_case(txt, value, width):
+    """ evaluates a (nested) case statement rendered with ui2h keys for a key value."""
+    import re
+    lines = txt.split('\n')
+    def run(i):
+        m = re.match(r'\s*case\(\w+(?:\[(\d+):(\d+)\])?\)', lines[i])
+        msb, lsb = (int(m.group(1)), int(m.group(2))) if m.group(1) else (width - 1, 0)
+        sel = (value >> lsb) & ((1 << (msb - lsb + 1)) - 1)
+        depth = len(lines[i]) - len(lines[i].lstrip())
+        i += 1
+        default = None
+        while lines[i].strip() != 'endcase' or len(lines[i]) - len(lines[i].lstrip()) != depth:
+            line = lines[i]
+            if len(line) - len(line.lstrip()) == depth + 3 and ':' in line:
+                cond, rest = line.strip().split(':', 1)
+                if cond == 'default':
+                    default = rest.strip()
+                elif int(cond.split("'h")[1], 16) == sel:
+                    rest = rest.strip()
+                    return run(i + 1) if rest == 'begin' else rest
+            i += 1
+        return default
+    return run(0)
+
+def test_case_tree():
+    items = [(k, eq('rd_o', f'r{k}')) for k in range(0, 1024, 7)] + [('default', eq('rd_o', "'0"))]
+    flat = case('addr_i', items, width = 10)
+    assert flat.count('case(') == 1
+    for fanout in (2, 4, 16):
+        tree = case('addr_i', list(reversed(items)), width = 10, fanout = fanout)
+        assert tree.count('case(') > 1
+        for k in range(0, 1024, 5):
+            assert _eval_case(tree, k, 10) == _eval_case(flat, k, 10)
+
+    with pytest.raises(ValueError):
+        case('addr_i', items, width = 10, fanout = 3)
+    # keys out of range are rejected, not masked into duplicate items
+    with pytest.raises(ValueError):
+        case('a', [(44, 'y;'), (300, 'x;')], width = 8)
+    with pytest.raises(ValueError):
+        case('a', [(-1, 'y;'), (3, 'x;')], width = 8, fanout = 2)
+
+def test_iterables():
+    stmts = [eq('a', 'b'), eq('c', 'd')]
+    decls = [logic('en'), logvec('cnt', 7, 0)]
+    ios = inputs(['clk_i', 'reset_n_i'])
+
+    assert indent(s for s in ['x', 'y\nz']) == indent(['x', 'y\nz']) == '   x\n   y\n   z'
+    assert indent(iter([])) == ''
+    assert block(s for s in stmts) == block(stmts)
+    assert block(s for s in stmts[:1]) == block(stmts[:1])
+    assert struct('s_t', (d for d in decls)) == struct('s_t', decls)
+    assert package('p', (d for d in decls)) == package('p', decls)
+    assert module('m', (s for s in stmts), ios = (i for i in ios)) == module('m', stmts, ios = ios)
+    assert module('m', stmts, ios = iter([])) == module('m', stmts)
+    items = [citem(ui2h(i, 2), eq('q', f'd{i}')) for i in range(4)]
+    assert case('s', (i for i in items)) == case('s', items)
+    assert case('s', ((i, eq('q', f'd{i}')) for i in range(4)), width = 2) == case('s', items)
+
+    with pytest.raises(ValueError):
+        struct('s_t', iter([]))
+    with pytest.raises(ValueError):
+        block(iter([]))
+
+    t1, t2 = SVTxt(), SVTxt()
+    t1.add(s for s in stmts)
+    t2.add(stmts)
+    t1.add(iter([]))
+    t2.add([])
+    assert t1.txt == t2.txt
+
+def test_render():
+    banks = [[eq(f'r{b}_{i}', f'd{b}_{i}') for i in range(50)] for b in range(6)]
+    ref = SVTxt()
+    for b in banks:
+        ref.add(always_comb(b))
+    ref.add(comment('done'))
+    for threads in (False, True):
+        t = SVTxt()
+        for b in banks:
+            t.defer(always_comb, b)
+        t.add(comment('done'))
+        t.render(workers = 3, threads = threads)
+        assert all(isinstance(c, str) for c in t._chunks)
+        assert t.txt == ref.txt
+    calls = []
+    def section(b):
+        calls.append(b)
+        return always_comb(b)
+    t = SVTxt(provenance = True)
+    t.defer(section, banks[0])
+    assert t.txt == t.txt == always_comb(banks[0]) + '\n'
+    t.source_map()
+    t.check()
+    t.to_module('m')
+    # rendered once, without render()
+    assert len(calls) == 1
+
+def test_spill(tmp_path):
+    def build(**kw):
+        t = SVTxt(provenance = True, coalesce_ff = True, **kw)
+        aff = t.make_always_ff()
+        for i in range(30):
+            t.add([logic(f'a{i}'), assign(f'a{i}', f'b{i}')])
+            aff(eq(f'r{i}', "'0"), eq(f'r{i}', f'a{i}'))
+            t.sep()
+        return t
+    a, b = build(), build(spill = 100)
+    assert b._spillf is not None and len(b._chunks) < len(a._chunks)
+    assert a.txt == b.txt and a.source_map() == b.source_map()
+    a.to_module('m', inputs(['clk_i']))
+    b.to_module('m', inputs(['clk_i']))
+    assert a.txt == b.txt and a.source_map() == b.source_map()
+    a.to_package('p')
+    b.to_package('p')
+    assert a.txt == b.txt
+    for t, d in ((a, 'a'), (b, 'b')):
+        (tmp_path / d).mkdir()
+        t.to_sv_file('x', str(tmp_path / d))
+        t.to_svh_file('y', str(tmp_path / d))
+    for f in ('x.sv', 'y.svh'):
+        assert (tmp_path / 'a' / f).read_text() == (tmp_path / 'b' / f).read_text()
+
+def test_align():
+    decls = [logic('en'), logvec('cnt', 7, 0, cmt = 'counter'), logic('busy', 'state')]
+    assert align_columns(decls) == ('logic       en;\n'
+                                    'logic [7:0] cnt;  // counter\n'
+                                    'logic       busy; // state')
+    assert align_columns([parameter('W', 8), parameter('DEPTH', 16), 'end', eq('a', 'b'), eq('bb[3:0]', 'c', block = True)]) == (
+        'parameter W     = 8;\nparameter DEPTH = 16;\nend\na       <= b;\nbb[3:0] =  c;')
+    assert struct('s_t', decls, align = True) == 'typedef struct packed {\n' + indent(align_columns(decls)) + '\n} s_t;'
+
+    items = [(1, eq('q', 'a')), (2, eq('q', 'b')), ('default', eq('q', "'0"))]
+    assert case('s', items, width = 2, align = True) == "case(s)\n   2'h1:    q <= a;\n   2'h2:    q <= b;\n   default: q <= '0;\nendcase\n"
+
+    ios = [Input('clk_i'), invec('data_i', 7, 0), Output('q_o')]
+    m = module('m', [logic('a'), logvec('b', 3, 0)], ios = ios, align = True)
+    assert '  ( input  logic       clk_i,\n    input  logic [7:0] data_i,\n    output logic       q_o\n' in m
+    assert '   logic       a;\n   logic [3:0] b;\n' in m
+    t = SVTxt(align = True)
+    t.add([logic('a'), logvec('b', 3, 0)])
+    t.to_module('m', ios)
+    assert t.txt.startswith(m[:m.index('b;') + 3])
+
+def test_symbols():
+    d = logvec('cnt', 7, 0)
+    assert d == 'logic [7:0] cnt;' and (d.name, d.width) == ('cnt', 8)
+    assert (invec('d_i', 'W-1', 0).width, Input('clk_i').width, Output('s_o', 'sfr_t').width) == (None, 1, None)
+    assert decl('logic [3:0]', 'x').width == 4
+
+    t = SVTxt()
+    t.declare([Input('clk_i'), outvec('th_o', 7, 0)])
+    t.add([logic('en'), logvec('cnt', 3, 0)])
+    assert t.lookup('cnt').width == 4 and t.lookup('nope') is None
+    assert t.width('th_o[3:0]') == 4 and t.width('th_o[2]') == 1 and t.width('th_o[i+:2]') == 2
+    assert t.eq('th_o', 0) == eq('th_o', ui2h(0, 8))
+    assert t.assign('cnt', 5, base = 'b') == assign('cnt', ui2b(5, 4))
+    assert t.eq('th_o[3:0]', 'cnt') == eq('th_o[3:0]', 'cnt')
+    with pytest.raises(ValueError):
+        t.eq('th_o', 'cnt')
+    with pytest.raises(ValueError):
+        t.eq('th_o', "4'h0")
+    with pytest.raises(ValueError):
+        t.eq('undeclared', 0)
+    t.to_module('m', [Input('clk_i'), outvec('th_o', 7, 0)])
+    assert t.width('th_o') == 8
+    t.txt = ''
+    assert t.lookup('cnt') is None
+
+    # duplicates: opt-in, and per scope (top level or region)
+    t = SVTxt(unique_decls = True)
+    t.add(logvec('x', 3, 0))
+    with pytest.raises(ValueError):
+        t.add(logic('x'))
+    with t.region('g0'):
+        t.add(logic('x'))
+    with t.region('g1'):
+        t.add(logic('x'))
+        with pytest.raises(ValueError):
+            t.add(logic('x'))
+    assert t.width('x') == 1
+    t.replace('g1', [])
+    t.replace('g0', [])
+    assert t.width('x') == 4
+    with pytest.raises(ValueError):
+        SVTxt(unique_decls = True).to_module('m', [Input('a'), Output('a')])
+    t = SVTxt()
+    t.add([logic('a'), logvec('a', 1, 0)])
+    assert t.width('a') == 2
+
+def test_regions(tmp_path):
+    def build(widths, **kw):
+        t = SVTxt(**kw)
+        t.add(logic('en'))
+        with t.region('regs'):
+            for i in range(3):
+                with t.region(f'r{i}'):
+                    t.add(logvec(f'r{i}', widths.get(i, 8) - 1, 0))
+        t.add(assign('x', 'y'))
+        return t
+    a, b = build({}), build({1: 16})
+    assert a.region_txt('r1') == 'logic [7:0] r1;\n'
+    a.replace('r1', logvec('r1', 15, 0))
+    assert a.txt == b.txt
+    with pytest.raises(ValueError):
+        a.region('r1')
+
+    a, b, c = build({}), build({2: 4}), build({2: 4}, provenance = True)
+    for t in (a, b, c):
+        t.to_module('m', inputs(['clk_i']))
+    outer = a._chunks[1]
+    assert outer.render() is outer.render()
+    a.replace('r2', logvec('r2', 3, 0))
+    assert a.txt == b.txt == c.txt
+    a.to_package('p')
+    a.replace('r2', logvec('r2', 7, 0))
+    t = build({})
+    t.to_module('m', inputs(['clk_i']))
+    t.to_package('p')
+    assert a.txt == t.txt
+    a.to_svh_file('p', str(tmp_path))
+    a.replace('r0', logvec('r0', 1, 0))
+    assert a.txt.count('logic [1:0] r0;') == 1 and a.txt.endswith('`endif')
+
+def test_regions_shared_ff():
+    t = SVTxt(coalesce_ff = True)
+    with t.region('r'):
+        t.add(logic('a'))
+        t.add_ff(eq('a', "1'b0"), eq('a', 'a_d'))
+    t.add(logic('b'))
+    t.add_ff(eq('b', "1'b0"), eq('b', 'b_d'))
+    t.to_module('m')
+    t.replace('r', logic('c'))
+    # the updates added outside of the region are kept
+    assert always_ff(eq('b', "1'b0"), eq('b', 'b_d')) in t.txt.replace('\n' + INDENT, '\n')
+    assert 'a_d' not in t.txt
+    t.replace('r', [logic('a')])
+    assert t.txt.count('always_ff') == 1
+
+def test_param_array():
+    import array
+    assert param_array('COEF', [18, -18, 1, 0, -1], 16, signed = True, line_width = 40) == (
+        "localparam logic signed [15:0] COEF [5] = '{\n"
+        "   16'sh0012, 16'shFFEE, 16'sh0001,\n"
+        "   16'sh0000, 16'shFFFF\n"
+        "};")
+    assert param_array('C', array.array('B', [1, 2]), 4, kind = 'parameter', fmt = 'b') == \
+        "parameter logic [3:0] C [2] = '{\n   4'b0001, 4'b0010\n};"
+    assert param_array('D', [5, -100], 8, signed = True, fmt = 'd') == \
+        "localparam logic signed [7:0] D [2] = '{\n   8'sd5, -8'sd100\n};"
+    lines = list(iter_param_array('BIG', range(1000), 10, line_width = 60))
+    assert all(len(l) <= 60 for l in lines) and len(lines) == 2 + -(-1000 // 6)
+    t = SVTxt()
+    t.add(iter_param_array('BIG', range(1000), 10, line_width = 60))
+    assert t.txt == '\n'.join(lines) + '\n'
+    assert list(iter_param_array('BIG', iter(range(1000)), 10, line_width = 60)) == lines
+    # lines are formatted as they are consumed
+    class Table(list):
+        def __getitem__(self, i):
+            reads.append(i)
+            return list.__getitem__(self, i)
+    reads = []
+    lines = iter_param_array('T', Table(range(1000)), 10, line_width = 60)
+    next(lines), next(lines)
+    assert reads == [0, slice(0, 6)]
+
+    with pytest.raises(ValueError):
+        param_array('X', [16], 4)
+    with pytest.raises(ValueError):
+        param_array('X', [-9], 4, signed = True)
+    with pytest.raises(ValueError):
+        param_array('X', [], 4)
+
+def test_module_registry(tmp_path):
+    reg = ModuleRegistry()
+    ios = [Input('clk_i'), outvec('q_o', 3, 0)]
+    body = [assign('q_o', "4'h0")]
+    first = reg.module('chan0', body, ios)
+    assert first == module('chan0', body, ios)
+    assert reg.module('chan1', body, ios) is None
+    assert reg.module('wide', body, ios + [Input('en_i')]) is not None
+    assert reg.module('chan0', body, ios) == first
+    assert dict(reg) == {'chan0': 'chan0', 'chan1': 'chan0', 'wide': 'wide'}
+    assert reg.canonical == ['chan0', 'wide']
+    with pytest.raises(ValueError):
+        reg.module('chan1', [assign('q_o', "4'h1")], ios)
+
+    for ch in range(3):
+        t = SVTxt()
+        t.add(body)
+        t.to_module(f'ch{ch}', ios, registry = reg)
+        assert t.duplicate_of() == (None if ch == 0 else 'ch0')
+        t.to_sv_file(f'ch{ch}', str(tmp_path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['ch0.sv']
+    assert reg['ch2'] == 'ch0'
+    # not wrapped with a registry
+    t = SVTxt()
+    t.add(body)
+    assert t._module is None and t.duplicate_of() is None
+
+def test_struct_layout():
+    hdr = Struct('hdr_t', [Field('len', 6), Field('last')])
+    pkt = Struct('pkt_t', [Field('hdr', struct = hdr), Field('data', 8, cmt = 'payload'),
+                           Field('kind', 2, typ = 'kind_e'), Field('n', typ = 'byte')])
+    assert (hdr.width, pkt.width) == (7, 25)
+    assert pkt.offsets == {'hdr': 18, 'hdr.len': 19, 'hdr.last': 18, 'data': 10, 'kind': 8, 'n': 0}
+    assert pkt.slice('hdr.len', 'bus') == 'bus[24:19]' and pkt.slice('hdr.last', 'bus') == 'bus[18]'
+    assert pkt['data'].width == 8 and 'hdr.len' in pkt and pkt.msb('hdr') == 24
+    assert hdr.typedef() == struct('hdr_t', [logvec('len', 5, 0), logic('last')])
+    assert pkt.typedef().splitlines()[1:3] == [f'{INDENT}hdr_t hdr;', f'{INDENT}logic [7:0] data; // payload']
+    assert localparam('PKT_HDR_LEN_LSB', 19) in pkt.localparams()
+    assert localparam('P_WIDTH', 25) in pkt.localparams('p')
+    pack, unpack = pkt.pack_function(), pkt.unpack_function()
+    assert pack.startswith('function automatic logic [24:0] pkt_pack(input pkt_t s);')
+    assert eq('v[24:18]', 's.hdr', block = True) in pack
+    assert eq('s.kind', "kind_e'(v[9:8])", block = True) in unpack
+    assert eq('s.n', 'v[7:0]', block = True) in unpack
+
+    t = SVTxt()
+    t.add(pkt.decl('pkt_q'))
+    assert t.width('pkt_q') == 25
+    with pytest.raises(ValueError):
+        Struct('e_t', [])
+    with pytest.raises(ValueError):
+        Struct('d_t', [Field('a'), Field('a')])
+    with pytest.raises(ValueError):
+        Field('k', typ = 'kind_e')
+    with pytest.raises(ValueError):
+        Field('n', 16, typ = 'byte')
+    assert Field('n', 8, typ = 'byte').width == 8
+
+def test_shard(tmp_path):
+    def gen():
+        t = SVTxt()
+        t.add([logvec(f'r{i}', 7, 0) for i in range(20)])
+        for i in range(20):
+            t.add(always_comb(eq(f'r{i}', f"8'd{i}", block = True)))
+        t.to_module('big', [Input('clk_i')], shard = True)
+        return t
+    ref = gen().txt
+    t = gen()
+    t.to_sv_file('big', str(tmp_path), shard = 200, workers = 4)
+    shards = [tmp_path / f'big_{i}.svh' for i in range(len(list(tmp_path.glob('big_*.svh'))))]
+    assert len(shards) == 5 and all(f.exists() for f in shards)
+    main = (tmp_path / 'big.sv').read_text()
+    assert f'{INDENT}`include "big_0.svh"\n' in main and main.endswith('endmodule\n\n')
+    # expanding the includes (without their guards) gives back the module
+    body = []
+    for i in range(len(shards)):
+        lines = (tmp_path / f'big_{i}.svh').read_text().split('\n')
+        assert lines[0] == ifndef(f'_BIG_{i}_SVH_')
+        body.append(indent('\n'.join(lines[4:-2])))
+    expanded = main[main.index('module big'):].replace(
+        '\n'.join(f'{INDENT}`include "big_{i}.svh"' for i in range(len(shards))), '\n'.join(body))
+    # (but for the indented empty line the body ends with)
+    assert expanded == ref.replace(f'\n{INDENT}\nendmodule', '\nendmodule') + '\n'
+    # unchanged shards are not rewritten
+    mtimes = [os.stat(f).st_mtime_ns for f in shards]
+    os.utime(shards[0], ns = (1, 1))
+    gen().to_sv_file('big', str(tmp_path), shard = 200)
+    assert os.stat(shards[0]).st_mtime_ns == 1
+    assert [os.stat(f).st_mtime_ns for f in shards[1:]] == mtimes[1:]
+    # the shards of a larger previous run are removed
+    gen().to_sv_file('big', str(tmp_path), shard = 600)
+    assert sorted(f.name for f in tmp_path.glob('big_*.svh')) == ['big_0.svh', 'big_1.svh']
+    with pytest.raises(ValueError):
+        SVTxt().to_sv_file('x', str(tmp_path), shard = 100)
+    # the fragments are only kept when sharding is requested
+    t = SVTxt()
+    t.add(logic('a'))
+    t.to_module('small')
+    assert t._layout is None
+    with pytest.raises(ValueError):
+        t.to_sv_file('small', str(tmp_path), shard = 100)
+
+def test_star_import():
+    import svtmp
+    ns = {}
+    exec('from svtmp import *', ns)
+    assert 'List' in ns and 'date' in ns
+    assert not {'re', 'sys', 'chain', 'weakref', 'Mapping', 'TYPE_CHECKING'} & set(ns)
+    # every public template and class of svtmp is exported
+    assert [n for n, v in vars(svtmp).items() if not n.startswith('_') and
+            getattr(v, '__module__', None) == 'svtmp' and n not in ns] == []
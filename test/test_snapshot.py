@@ -0,0 +1,58 @@
+import os
+from datetime import date
+from svtmp import *
+from svtmp.__main__ import main
+from svtmp.snapshot import Snapshot
+
+def generate(path, n, last = 0):
+    for i in range(n):
+        t = SVTxt()
+        t.add(assign('q_o', f"8'd{last if i == n - 1 else i}"))
+        t.to_module(f'm{i}', [outvec('q_o', 7, 0)])
+        t.to_sv_file(f'm{i}', path, prj = 'snapshot')
+
+def test_snapshot(tmp_path):
+    rtl, store = tmp_path / 'rtl', str(tmp_path / 'golden')
+    os.makedirs(rtl / 'sub')
+    generate(str(rtl), 4, last = 3)
+    generate(str(rtl / 'sub'), 2, last = 1)
+    assert Snapshot(store).record(str(rtl), text = True) == 6
+
+    snap = Snapshot(store)
+    assert sorted(snap.entries)[-2:] == ['sub/m0.sv', 'sub/m1.sv']
+    assert snap.verify(str(rtl))
+    # the header date and copyright year are ignored
+    f = rtl / 'm0.sv'
+    year = f'AG {date.today().year} -'
+    assert year in f.read_text()
+    f.write_text(f.read_text().replace(date.today().isoformat(), '1999-01-01').replace(year, 'AG 1999 -'))
+    assert snap.verify(str(rtl))
+
+    generate(str(rtl), 4, last = 7)     # m3 changes
+    (rtl / 'm4.sv').write_text((rtl / 'm0.sv').read_text())
+    os.remove(rtl / 'sub' / 'm1.sv')
+    result = snap.verify(str(rtl), workers = 2)
+    assert not result
+    assert (result.changed, result.missing, result.new) == (['m3.sv'], ['sub/m1.sv'], ['m4.sv'])
+    d = snap.diff(str(rtl), 'm3.sv')
+    assert "-   assign q_o = 8'd3;" in d and "+   assign q_o = 8'd7;" in d
+    assert Snapshot(store).verify(str(rtl)).changed == ['m3.sv']
+
+    # without texts, no diffs (and no stored objects)
+    snap.record(str(rtl))
+    assert [f for _, _, fs in os.walk(os.path.join(store, 'objects')) for f in fs] == []
+    assert snap.diff(str(rtl), 'm3.sv') is None
+
+def test_snapshot_cli(tmp_path, capsys):
+    rtl, store = str(tmp_path / 'rtl'), str(tmp_path / 'golden')
+    os.makedirs(rtl)
+    generate(rtl, 2, last = 1)
+    main(['snapshot', 'update', rtl, '-s', store, '--text'])
+    main(['snapshot', 'verify', rtl, '-s', store])
+    generate(rtl, 2, last = 5)
+    try:
+        main(['snapshot', 'verify', rtl, '-s', store, '--diff'])
+        assert False, 'verify should fail'
+    except SystemExit as e:
+        assert e.code == 1
+    assert "+   assign q_o = 8'd5;" in capsys.readouterr().out
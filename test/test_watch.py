@@ -0,0 +1,55 @@
+import os
+import sys
+import pytest
+from svtmp.watch import Watcher
+
+SCRIPT_A = '''
+from svtmp import *
+t = SVTxt()
+with open('spec.txt') as f:
+    for name in f.read().split():
+        t.add(logic(name))
+t.to_sv_file('a', OUT)
+'''
+
+SCRIPT_B = '''
+from svtmp import *
+from wlib import WIDTH
+t = SVTxt()
+t.add(logvec('q', WIDTH - 1, 0))
+t.to_sv_file('b', OUT)
+'''
+
+def touch(path, txt):
+    with open(path, 'w') as f:
+        f.write(txt)
+    st = os.stat(path)
+    os.utime(path, ns = (st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+@pytest.mark.skipif(not hasattr(sys, 'addaudithook'), reason = 'data files are tracked on python 3.8+')
+def test_watcher(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    out = repr(str(tmp_path))
+    (tmp_path / 'spec.txt').write_text('x y')
+    (tmp_path / 'wlib.py').write_text('WIDTH = 4\n')
+    (tmp_path / 'gen_a.py').write_text(f'OUT = {out}\n' + SCRIPT_A)
+    (tmp_path / 'gen_b.py').write_text(f'OUT = {out}\n' + SCRIPT_B)
+    w = Watcher(['gen_a.py', 'gen_b.py'])
+    a, b = w.scripts
+    try:
+        assert w.run(a) and w.run(b)
+        assert w.step() == []
+        spec, wlib = str((tmp_path / 'spec.txt').resolve()), str((tmp_path / 'wlib.py').resolve())
+        assert spec in w.inputs[a] and spec not in w.inputs[b]
+        assert wlib in w.inputs[b] and wlib not in w.inputs[a]
+        assert spec in w.outputs[a][str((tmp_path / 'a.sv').resolve())]
+
+        touch(tmp_path / 'spec.txt', 'x y z')
+        assert w.step() == [a]
+        assert 'logic z;' in (tmp_path / 'a.sv').read_text()
+
+        touch(tmp_path / 'wlib.py', 'WIDTH = 8\n')
+        assert w.step() == [b]
+        assert 'logic [7:0] q;' in (tmp_path / 'b.sv').read_text()
+    finally:
+        sys.modules.pop('wlib', None)